@@ -1,32 +1,161 @@
 #!/usr/bin/env python3
+import array
+import io
+import json
+import mmap
+import os
+import pickle
+import re
 import sys
 import textwrap
 import traceback
+from collections import namedtuple
+from types import MappingProxyType
+
+if __name__ == "__main__":
+    import complete     # run as a script (the self test), the package dir is sys.path[0]
+else:
+    from . import complete
 
 debugfn = None      # Set to a fn(str) to enable the internal debugging.
 
-# Use the debug function if set.
-def debug(str):
+# Use the debug function if set. The message is formatted (msg % args) only when debugging is enabled.
+def debug(msg, *args):
     if debugfn:
-        debugfn(str)
+        debugfn(msg % args if args else msg)
 
 unicode=type(str)
 
+_EMPTY_MAP = MappingProxyType({})   # shared by all the objects with no options
+
+class _TrieNode(object):
+    """
+    A Namespace trie node - one per dotted name prefix.
+    keys: the full keys under this node (i.e. that start with the node prefix), by insertion order.
+    """
+    __slots__ = ("children", "keys")
+
+    def __init__(self):
+        self.children = {}
+        self.keys = {}  # used as an ordered set
+
+
+class _NamespaceStore(object):
+    """
+    The storage shared by a Namespace and all its views.
+    values: the namespace own values, where the keys that are not in a layer are indexed by the trie.
+    layers: read only (template) stores the namespace is overlaid on (copy-on-write), e.g. options defaults.
+    order: the keys iteration order - layers and lists of own keys, in the order they were added.
+    """
+    __slots__ = ("values", "root", "layers", "order")
+
+    def __init__(self):
+        self.values = {}
+        self.root = _TrieNode()
+        self.layers = []
+        self.order = []
+
+    def get(self, key, default=None):
+        if key in self.values:
+            return self.values[key]
+        for layer in self.layers:
+            if key in layer.values:
+                return layer.values[key]
+        return default
+
+    def __contains__(self, key):
+        if key in self.values:
+            return True
+        for layer in self.layers:
+            if key in layer.values:
+                return True
+        return False
+
+    def set(self, key, value):
+        if key not in self:
+            node = self.root
+            node.keys[key] = None
+            for part in key.split(".")[:-1]:
+                child = node.children.get(part)
+                if child is None:
+                    child = node.children[part] = _TrieNode()
+                node = child
+                node.keys[key] = None
+            if not self.order or not isinstance(self.order[-1], list):
+                self.order.append([])
+            self.order[-1].append(key)
+        self.values[key] = value
+
+    def overlay(self, layer):
+        self.layers.append(layer)
+        self.order.append(layer)
+
+    def node(self, prefix):
+        node = self.root
+        if prefix:
+            for part in prefix.split(".")[:-1]:
+                node = node.children.get(part)
+                if node is None:
+                    return None
+        return node
+
+    def keys(self, prefix):
+        node = self.node(prefix)
+        for seg in self.order:
+            if isinstance(seg, list):
+                if node is not None:
+                    for k in seg:
+                        if k in node.keys:
+                            yield k
+            else:
+                layer_node = seg.node(prefix)
+                if layer_node is not None:
+                    for k in layer_node.keys:
+                        yield k
+
+
 class Namespace(object):
     """
     Generic namespace, similar to dict but enables also field references (e.g. ns.x = 4).
+    Dotted keys (e.g. "class.new.name") are indexed by a trie, so a sub namespace lookup (e.g. ns.class.new) costs
+    O(depth) and returns a view of the keys under that prefix, without copying.
     """
+    __slots__ = ("_Namespace__store", "_Namespace__prefix")
+
     def __init__(self):
-        pass
+        self.__init(_NamespaceStore(), "")
+
+    def __init(self, store, prefix):
+        object.__setattr__(self, "_Namespace__store", store)
+        object.__setattr__(self, "_Namespace__prefix", prefix)
+
+    def __view(self, prefix):
+        ns = Namespace.__new__(Namespace)
+        ns.__init(self.__store, prefix)
+        return ns
+
+    def _overlay(self, template):
+        """
+        Overlay the namespace on a template namespace (copy-on-write): the template keys are visible in this
+        namespace (at their template order position) unless they are set here. The template is not copied and
+        must not be modified afterwards.
+        :param template: a Namespace (not a view).
+        """
+        assert not template.__prefix
+        self.__store.overlay(template.__store)
 
     def __iter__(self):
-        for t in self.__dict__:
-            yield t
+        n = len(self.__prefix)
+        for k in self.__store.keys(self.__prefix):
+            yield k[n:]
 
     def next(self):
-        for t in self.__dict__:
+        for t in self:
             yield t
 
+    def __contains__(self, item):
+        return (self.__prefix + item) in self.__store
+
     def __getitem__(self, item, default=None):
         '''
         Lookup for item with support for nested '.' notation.
@@ -34,29 +163,45 @@ class Namespace(object):
         :param default:
         :return:
         '''
-        if item in self.__dict__:
-            return self.__dict__.get(item)
-        # generate a sub ns
-        ns = Namespace()
-        item += "."
-        for k in self.__dict__:
-            if k.startswith(item):
-                ns[k[len(item):]] = self.__dict__[k]
-        if not ns:
-            return None
-        return ns
+        key = self.__prefix + item
+        store = self.__store
+        if key in store.values:
+            return store.values[key]
+        for layer in store.layers:
+            if key in layer.values:
+                return layer.values[key]
+        # generate a sub ns view
+        return self.__view(key + ".")
 
     def __setitem__(self, item, value):
-        return self.__dict__.__setitem__(item, value)
+        self.__store.set(self.__prefix + item, value)
 
     def __getattr__(self, item):
+        if item.startswith("__") or item.startswith("_Namespace__"):
+            raise AttributeError(item)
         return self.__getitem__(item)
 
+    def __setattr__(self, item, value):
+        self.__setitem__(item, value)
+
+    def __reduce__(self):
+        # copy/pickle a view as a new namespace
+        return (_namespace, ([(k, self[k]) for k in self],))
+
     def __str__(self):
-        return str(self.__dict__)
+        if not self.__prefix and not self.__store.layers:
+            return str(self.__store.values)
+        return str(dict((k, self[k]) for k in self))
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str(self)
+
+def _namespace(items):
+    ns = Namespace()
+    for k, v in items:
+        ns[k] = v
+    return ns
+
 
 class CliResult(object):
     """
@@ -137,6 +282,21 @@ class CliResult(object):
         self.__command_options[name] = opt
         self.__levels_ns[level][name] = val
 
+    def add_defaults(self, level, defaults, level_defaults):
+        """
+        Add the options defaults of the given level. The defaults are not copied but overlaid (see Namespace._overlay)
+        so only the options that are set later are written.
+        init_level() must be called before any call to this function for every level.
+        :param level: The target level.
+        :param defaults: Namespace of the defaults by full name.
+        :param level_defaults: Namespace of the defaults by option name.
+        :return:
+        """
+        if level > self.__max_level:
+            raise ParseExecption("add_defaults at level %s has bad level (max %d)" % (level, self.__max_level))
+        self.__ns._overlay(defaults)
+        self.__levels_ns[level]._overlay(level_defaults)
+
     def __setitem__(self, item, value):
         return self.__ns.__setitem__(item, value)
 
@@ -219,7 +379,11 @@ class ParseExecption(Exception):
     def __init__(self, description):
         Exception.__init__(self)
         self.description = description
-        self.trace = traceback.format_exc()
+        self.__exc_info = sys.exc_info()    # the trace is formatted only when it is used
+
+    @property
+    def trace(self):
+        return "".join(traceback.format_exception(*self.__exc_info)) if self.__exc_info[0] else "NoneType: None\n"
 
     def __str__(self):
         return "%s. Use --help to get usage." % (self.description)
@@ -296,9 +460,352 @@ def _defhelpfn(ent):
     defhelpfn(ent)
 
 
+class _Tokenizer(object):
+    """
+    The MultiLevelCliBase.tokenize() engine for a given set of special chars.
+    Instead of building the tokens char by char, the string is scanned for the next char that is special in the
+    current state (top level, inside a group or inside a quote) and the tokens are sliced between the top level
+    separators. Strings with no grouping, escaping or quoting chars are just split.
+    """
+    ends = { '[' : ']', '{' :'}'}
+
+    def __init__(self, sep, grouping, escaping, quoting):
+        def charset(chars):
+            return "".join(re.escape(c) for c in chars)
+        self.grouping = frozenset(grouping)
+        self.escaping = frozenset(escaping)
+        self.quoting = frozenset(quoting)
+        sepset = r"\s" if sep is None else charset(sep)
+        self.sep = sep
+        self.split = None if sep is None else re.compile("[%s]" % sepset).split
+        self.special = re.compile("[%s]" % charset(list(grouping) + list(escaping) + list(quoting)))
+        self.top = re.compile("[%s%s]" % (charset(list(grouping) + list(escaping) + list(quoting)), sepset))
+        self.group = re.compile("[%s]" % charset(list(grouping) + list(escaping) + [self.ends[c] for c in grouping]))
+        self.quoted = dict((q, re.compile("[%s]" % charset(list(escaping) + [q]))) for q in quoting)
+
+    def __call__(self, s):
+        if not self.special.search(s):
+            # no grouping, escaping or quoting - plain split
+            if self.sep is None:
+                return s.split()
+            return [t for t in (t.strip() for t in self.split(s)) if t]
+
+        tokens = []
+        groups = [] # items: tne end marker of the group. Each nested group will lead to another item.
+        quoted = None
+        start = 0   # the start of the current token
+        pos = 0
+        while True:
+            if quoted:
+                m = self.quoted[quoted].search(s, pos)
+            elif groups:
+                m = self.group.search(s, pos)
+            else:
+                m = self.top.search(s, pos)
+            if m is None:
+                break
+            i = m.start()
+            c = s[i]
+            pos = i + 1
+            if c in self.escaping:
+                pos += 1    # the next char is always a normal char
+            elif quoted:
+                quoted = None   # only the escaping and the closing quote chars are searched for
+            elif groups:
+                if c in self.grouping:
+                    groups.append(self.ends[c])
+                elif c == groups[-1]:
+                    del groups[-1]
+            elif c in self.quoting:
+                quoted = c
+            elif c in self.grouping:
+                groups.append(self.ends[c])
+            else:
+                # a top level seperator
+                token = s[start:i].strip()
+                if token:
+                    tokens.append(token)
+                start = pos
+
+        token = s[start:].strip()
+        if token:
+            tokens.append(token)
+        if groups:
+            raise ParseExecption("'%s' - the following groups are unbalanced '%s'" % (s, str(groups)))
+        if quoted:
+            raise ParseExecption("'%s' - the following quoting is not balanced '%s'" % (s, str(quoted)))
+        return tokens
+
+
+class _Scalar(object):
+    """
+    Compiled converter of a scalar value to a python type: the token is stripped of quotes and whitespace (see
+    MultiLevelCliBase.strip()) and converted.
+    """
+    __slots__ = ("type", "owner")
+
+    @staticmethod
+    def compile(argtype, owner):
+        """
+        :param argtype: the python type.
+        :param owner: the argument/option (or the list/struct) of the value, used in the error messages.
+        :return: the converter of argtype values.
+        """
+        return _Str(argtype, owner) if argtype is str else _Scalar(argtype, owner)
+
+    def __init__(self, argtype, owner):
+        self.type = argtype
+        self.owner = owner
+
+    def __call__(self, token):
+        try:
+            return self.type(token.strip("\"'").strip())
+        except Exception:
+            raise self.error(token)
+
+    def error(self, token):
+        return ArgumentTypeError("Parse error at token '%s' [arg %s], can't convert to type %s" % (
+            token, self.owner.full_name(".", lastsep=True) + self.owner.name, self.type))
+
+    def _read(self, parser, pos, end):
+        return parser.scalar(self, pos, end)
+
+    def _coerce(self, value):
+        """
+        Convert a decoded JSON value (see _ValueFile). Only lossless conversions are made: a value of the type is used
+        as is, an int is converted to float and a (non null) scalar to str. Types other than the JSON scalar types are
+        converted from JSON strings, as from the literal syntax.
+        """
+        t = type(value)
+        if t is self.type:
+            return value
+        if t is int and self.type is float:
+            return float(value)
+        if self.type is str and t in (int, float, bool):
+            return json.dumps(value)
+        if t is str and self.type not in (int, float, bool):
+            try:
+                return self.type(value)
+            except Exception:
+                pass
+        raise self.error(json.dumps(value))
+
+
+class _Str(_Scalar):
+    __slots__ = ()
+
+    def __call__(self, token):
+        return token.strip("\"'").strip()
+
+
+class _ValueFile(object):
+    """
+    Argument and option values that are read from a file: '@path', or '@-' for stdin. '@@...' is the literal value
+    '@...'. Regular files are memory mapped and decoded in place, other files (pipes, stdin) are read in one go, so the
+    value text is not copied through the command line tokenizer. List and struct values may be written either in the
+    literal syntax or in JSON (decoded by the json module and converted by the compiled types).
+    """
+    __slots__ = ()
+    encoding = "utf-8"
+    stdin = True    # False while parsing command lines that are read from stdin (see MultiLevelArgParse.parse_many())
+
+    @staticmethod
+    def value(owner, token):
+        """
+        :param owner: the argument or option.
+        :param token: the value token that starts with '@'.
+        :return: the converted value.
+        """
+        if token.startswith("@@"):
+            return owner.convert(token[1:])
+        text = _ValueFile.read(owner, token[1:])
+        literal = owner._literal_type()
+        if literal is None:
+            return owner.convert(text)
+        try:
+            value = json.loads(text)
+        except ValueError:
+            # not JSON, the literal syntax
+            return literal._parse_literal(text)
+        return literal._coerce(value)
+
+    @staticmethod
+    def read(owner, path):
+        """
+        :return: the decoded text of the file (or stdin for '-').
+        """
+        try:
+            if path == "-":
+                if not _ValueFile.stdin:
+                    raise ArgumentTypeError("Can't read the value of [arg %s] from stdin, the commands are read from "
+                                            "stdin" % (owner.full_name(".", lastsep=True) + owner.name))
+                return sys.stdin.read()
+            with open(os.path.expanduser(path), "rb") as f:
+                try:
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, OSError):
+                    # an empty or a non regular file
+                    return f.read().decode(_ValueFile.encoding)
+                with m:
+                    return str(m, _ValueFile.encoding)
+        except (OSError, UnicodeDecodeError) as e:
+            raise ArgumentTypeError("Can't read the value of [arg %s] from '%s': %s" % (
+                owner.full_name(".", lastsep=True) + owner.name, path, e))
+
+
+class _LiteralParser(object):
+    """
+    Recursive descent parser of the list and struct argument literals: [v1, v2, ...] and {k1=v1, k2=v2, ...}. The
+    values are converted by the compiled element types of the literal type (a ListType or a StructType) and the nested
+    literals are parsed in place, by their (start, end) positions in the literal rather than by tokenizing copies of
+    their text. The literal is split exactly as by the tokenizer (see MultiLevelCliBase.tokenize()): a literal is
+    closed by its last char, its elements are separated by the top level ',' (and the struct fields by '='), quoted
+    text and escaped chars are not special (quotes only at the top level), and empty elements are skipped. The scalar
+    values are stripped of whitespace and quotes (see MultiLevelCliBase.strip()).
+    """
+    ends = { '[' : ']', '{' :'}'}
+    _special = re.compile(r"[\\\"'\[{,=]")     # the special chars at the top level of a literal
+    _grouped = re.compile(r"[\\\[\]{}]")        # the special chars in a group
+
+    def __init__(self, s):
+        self.s = s
+
+    def parse(self, argtype):
+        """
+        Parse the entire literal.
+        :param argtype: the literal ListType or StructType.
+        :return: the value (list or Namespace).
+        """
+        return argtype._literal(self, *self.strip(0, len(self.s)))
+
+    def error(self, argtype, msg, cls=None):
+        return (cls or ArgumentTypeError)("%s: Parse error at token '%s' [arg %s], %s" % (
+            argtype.__class__.__name__, self.s, argtype.full_name(".", lastsep=True) + argtype.name, msg))
+
+    def strip(self, pos, end):
+        """
+        :return: the (pos, end) of the text between pos and end, stripped of whitespace.
+        """
+        s = self.s
+        while pos < end and s[pos].isspace():
+            pos += 1
+        while end > pos and s[end - 1].isspace():
+            end -= 1
+        return pos, end
+
+    def scan(self, pos, stops, end):
+        """
+        Scan a top level element of the text between pos and end.
+        :return: the position of the first top level stop char at or after pos, or end.
+        """
+        s = self.s
+        groups = []     # the expected ends of the open groups
+        while True:
+            m = (self._grouped if groups else self._special).search(s, pos, end)
+            if not m:
+                if groups:
+                    raise ParseExecption("'%s' - the following groups are unbalanced '%s'" % (s[:end], groups))
+                return end
+            pos = m.start()
+            c = s[pos]
+            if c == '\\':
+                pos += 2    # the next char is always a normal char
+            elif groups:
+                if c in self.ends:
+                    groups.append(self.ends[c])
+                elif c == groups[-1]:
+                    del groups[-1]
+                pos += 1
+            elif c == '"' or c == "'":
+                pos = self.skip_quoted(pos, end)
+            elif c in self.ends:
+                groups.append(self.ends[c])
+                pos += 1
+            elif c in stops:
+                return pos
+            else:
+                pos += 1
+
+    def skip_quoted(self, pos, end):
+        """
+        :return: the position after the closing quote of the quote at pos.
+        """
+        s = self.s
+        quote = s[pos]
+        pos += 1
+        while True:
+            close = s.find(quote, pos, end)
+            if close < 0:
+                raise ParseExecption("'%s' - the following quoting is not balanced '%s'" % (s[:end], quote))
+            escape = s.find('\\', pos, close)
+            if escape < 0:
+                return close + 1
+            pos = escape + 2
+
+    def split(self, pos, sep, end):
+        """
+        Generate the (pos, end) of the non empty top level elements of the text between pos and end, separated by the
+        sep char.
+        """
+        while pos < end:
+            stop = self.scan(pos, sep, end)
+            element = self.strip(pos, stop)
+            if element[0] < element[1]:
+                yield element
+            pos = stop + 1
+
+    def scalar(self, convert, pos, end):
+        """
+        Convert the scalar value between pos and end.
+        :param convert: the compiled value type (_Scalar).
+        """
+        return convert(self.s[pos:end])
+
+    def nested(self, argtype, pos, end):
+        """
+        Parse the nested literal between pos and end.
+        :param argtype: the nested ListType/StructType.
+        """
+        return argtype._literal(self, pos, end)
+
+    def list(self, argtype, pos, end):
+        s = self.s
+        if end - pos < 2 or s[pos] != '[' or s[end - 1] != ']':
+            raise self.error(argtype, "must conform to '[v1, v2,...]' format")
+        read = argtype._element._read
+        # split before converting, so the syntax errors come first (as by the tokenizer)
+        return [read(self, start, stop) for start, stop in list(self.split(pos + 1, ",", end - 1))]
+
+    def struct(self, argtype, pos, end):
+        s = self.s
+        if end - pos < 2 or s[pos] != '{' or s[end - 1] != '}':
+            raise self.error(argtype, "must conform to '{k1=v1, k2=v2,...}' format")
+        fields = argtype._fields
+        struct = Namespace()
+        for start, stop in list(self.split(pos + 1, ",", end - 1)):
+            keyval = list(self.split(start, "=", stop))
+            if len(keyval) != 2:
+                raise self.error(argtype, "can not parse 'key = value' at '%s'" % s[start:stop])
+            (k, k_end), (v, v_end) = keyval
+            k = MultiLevelCliBase.strip(s[k:k_end])
+            field = fields.get(k)
+            if field is None:
+                raise self.error(argtype, "unknown key '%s'" % k, ArgumentKeyError)
+            if not isinstance(field, _Scalar):
+                # a nested literal value is stripped of quotes as well
+                while v < v_end and s[v] in "\"'":
+                    v += 1
+                while v_end > v and s[v_end - 1] in "\"'":
+                    v_end -= 1
+                v, v_end = self.strip(v, v_end)
+            struct[k] = field._read(self, v, v_end)
+        return struct
+
+
 class MultiLevelCliBase(object):
     helpwidth = 80
     prog = ""
+    _tokenizers = {}    # tokenize() engines cache, by the special chars
 
     @staticmethod
     def tokenize(s, sep = None, grouping = ['[', '{'], escaping = ['\\'], quoting= ['"', '\'']):
@@ -315,89 +822,94 @@ class MultiLevelCliBase(object):
                 The default quoting chars are ' "
         :return: array of sting tokens.
         '''
-        ends = { '[' : ']', '{' :'}'}
-        tokens = []
-        groups = [] # items: tne end marker of the group. Each nested group will lead to another item.
-        quoted = None
-        cur = ""
-        escape = False
-        for c in s:
-            if escape:
-                cur += c
-                escape = False
-                continue
-            if c in escaping:
-                cur += c
-                escape = True
-                continue
-
-            # if we start or end quating, remove the quote marker, else just add it
-            if c in quoting and not groups:
-                if quoted and quoted == c:
-                    quoted = None
-                elif not quoted:
-                    quoted = c
-                cur += c
-                continue
+        return MultiLevelCliBase._tokenizer(sep, grouping, escaping, quoting)(s)
 
-            if quoted:
-                cur += c
-                continue
+    @staticmethod
+    def _tokenizer(sep = None, grouping = ['[', '{'], escaping = ['\\'], quoting= ['"', '\'']):
+        key = (None if sep is None else tuple(sep), tuple(grouping), tuple(escaping), tuple(quoting))
+        tokenizer = MultiLevelCliBase._tokenizers.get(key)
+        if tokenizer is None:
+            tokenizer = MultiLevelCliBase._tokenizers[key] = _Tokenizer(sep, grouping, escaping, quoting)
+        return tokenizer
 
-            if c in grouping and (not c in groups):
-                groups.append(ends[c])
-                cur += c
-                continue
+    @staticmethod
+    def tokenize_argv(argv):
+        '''
+        Convert an argv list (already split and unquoted by the shell) to parse tokens. The args are used as is,
+        short of list/struct literals: an arg that starts with a grouping char is joined with the following args
+        while its groups are unbalanced (e.g. argv of [ 5, 11 ] is "[", "5,", "11", "]") and only then tokenized.
+        Grouping chars inside an arg (e.g. "network [for] prod") or groups that never balance are left as is.
+        :param argv: list of strings, e.g. sys.argv[1:].
+        :return: list of string tokens.
+        '''
+        def depth(arg):
+            return arg.count('[') + arg.count('{') - arg.count(']') - arg.count('}')
 
-            if groups and c == groups[-1]:
-                del groups[-1]
-                cur += c
+        tokens = []
+        i = 0
+        n = len(argv)
+        while i < n:
+            arg = argv[i]
+            i += 1
+            if not arg.lstrip().startswith(('[', '{')):
+                tokens.append(arg)
                 continue
-
-            if not groups and (str(c).isspace() if sep is None else c in sep):
-                token = cur.strip()
-                if not token:
-                    continue
-                tokens.append(token)
-                cur = ""
+            literal = arg
+            level = depth(arg)
+            j = i
+            while level > 0 and j < n:
+                level += depth(argv[j])
+                literal += " " + argv[j]
+                j += 1
+            if level > 0:
+                tokens.append(arg)  # unbalanced, let the value converter report it
                 continue
-
-            cur += c
-
-        if cur:
-            token = cur.strip()
-            if token:
-                tokens.append(token)
-        if groups:
-            raise ParseExecption("'%s' - the following groups are unbalanced '%s'" % (s, str(groups)))
-        if quoted:
-            raise ParseExecption("'%s' - the following quoting is not balanced '%s'" % (s, str(quoted)))
+            i = j
+            tokens.extend(MultiLevelCliBase.tokenize(literal))
         return tokens
 
     class ParseBase(object):
         """
         Base object for comamnds and groups. Shouldn't be used directly.
+        The option maps are allocated only when the first option is added.
         """
+        __slots__ = ("name", "parent", "level", "description", "_options", "_longoptions", "helpfn", "_frozen",
+                     "_path", "_spath", "_defaults_ns")
+
         def __init__(self, name, parent, description, helpfn):
-            debug("Add name '%s' parent '%s' description '%s', defhelpfn '%s'" % (name, parent, description, helpfn))
+            debug("Add name '%s' parent '%s' description '%s', defhelpfn '%s'", name, parent, description, helpfn)
             assert parent is None or self.valid_name(name)
             assert parent is None or isinstance(parent, MultiLevelCliBase.ParseBase)
             assert description is None or isinstance(description, (str,unicode))
             assert helpfn is None or callable(helpfn)
             self.name = name
             self.parent = parent
-            self.level = self.__level(0)    # must be set after self.parent
+            # the level and the full names are computed once, when the object is attached to its parent
+            if parent is None:
+                self.level = 0
+                self._path = self._spath = ""
+            else:
+                self.level = parent.level + 1
+                self._path = parent._path + name + "."
+                self._spath = parent._spath + name + " "
             self.description = description
-            self.options = {}
-            self.longoptions = {}
+            self._options = None
+            self._longoptions = None
+            self._defaults_ns = None
             self.helpfn = helpfn
+            self._frozen = False
             if helpfn:
                 self.add_option("h", "help", description="help screen (this screen)")
 
-        def __level(self, level):
-            if self.parent is None:
-                return level
-            return self.parent.__level(level+1)
+        @property
+        def options(self):
+            """ short name -> option map """
+            return self._options if self._options is not None else _EMPTY_MAP
+
+        @property
+        def longoptions(self):
+            """ long name -> option map """
+            return self._longoptions if self._longoptions is not None else _EMPTY_MAP
 
         def __str__(self):
             return self.name
@@ -416,12 +928,16 @@ class MultiLevelCliBase(object):
             name = name.replace("_","")
             # "_" are allowed, but at least the first non _ char must be alpha
             valid = name and self.urlvalid(name)
-            debug("NON valid '%s'" % name)
             if not valid:
-                debug("NON valid '%s'" % name)
+                debug("NON valid '%s'", name)
             return valid
 
 
+        def check_mutable(self):
+            """ raise if the tree this object belongs to was frozen (see MultiLevelArgParse.freeze()) """
+            if self._frozen:
+                raise ParseExecption("'%s': can't modify a frozen cli tree" % (self.full_name(".") or self.name))
+
         def full_name(self, sep = " ", lastsep=False):
             """
             Returns full qualified name of the object e.g. "class<sep>subclass<sep>command"
@@ -431,9 +947,15 @@ class MultiLevelCliBase(object):
             """
             if not self.parent:
                 return ""
-            return self.parent.full_name(sep, lastsep=True) + self.name + (sep if lastsep else "")
+            if sep == ".":
+                path = self._path
+            elif sep == " ":
+                path = self._spath
+            else:
+                return self.parent.full_name(sep, lastsep=True) + self.name + (sep if lastsep else "")
+            return path if lastsep else path[:-1]
 
-        def add_option(self, short, long = None, name=None, type=None, description=None, default=None):
+        def add_option(self, short, long = None, name=None, type=None, description=None, default=None, packed=False):
             """
             Add an option to the current command/group. Options may have short name and/or long name. In addition if
             'name' is provided it is used as the target name. If name is not given then the long name is used,
@@ -446,28 +968,37 @@ class MultiLevelCliBase(object):
             :param description: an optional description to be used in the help/usage screens.
             :param default: an optional value to be used if the option is not provided. The default must be of the same
                     type of the opttype.
+            :param packed: for [int] or [float] types, the value is a packed array.array (see ListType).
             :return: the new option object.
             """
+            self.check_mutable()
             if not name:
                 name = long if long else short
-            return self.__add_option(MultiLevelCliBase.OptionType(short, long, self, name=name, opttype=type, description=description, default=default))
+            return self.__add_option(MultiLevelCliBase.OptionType(short, long, self, name=name, opttype=type, description=description,
+                                                                  default=default, packed=packed))
 
         def __add_option(self, opt):
             assert isinstance(opt, MultiLevelCliBase.OptionType)
             assert not opt.short or not opt.short in [x.short for x in self.options.values()]
             assert not opt.long or not opt.long in [x.long for x in self.longoptions.values()]
+            self._defaults_ns = None
             if opt.short:
-                self.options[opt.short] = opt
+                if self._options is None:
+                    self._options = {}
+                self._options[opt.short] = opt
             if opt.long:
-                self.longoptions[opt.long] = opt
+                if self._longoptions is None:
+                    self._longoptions = {}
+                self._longoptions[opt.long] = opt
             return opt
 
-        def parse_option(self, cli, optname, tokens, long=False):
+        def parse_option(self, cli, optname, tokens, i, long=False):
             """
             Parse the given option 'optname' using the 'tokens' in the current (command/group) context.
             :param cli: the CLI result object.
             :param optname: the option name as it is provided in the command line
-            :param tokens: the command line tokens starting from optname.
+            :param tokens: the command line tokens.
+            :param i: the index of the optname token.
             :param long: If true the option is looked up as long option, otherwise it is assumed to be short.
             :return: The number of tokens consumed.
             """
@@ -476,33 +1007,54 @@ class MultiLevelCliBase(object):
             except Exception:
                 raise OptionNotFound("Option %s%s not found" % (self.parent.full_name(".", lastsep=True) if self.parent else "",optname))
             assert isinstance(opt, MultiLevelCliBase.OptionType)
-            if opt.argtype is not None and not tokens:
+            if opt.argtype is not None and i + 1 >= len(tokens):
                 raise OptionNoParam("Option %s requires a parameter" % optname)
-            tokens = opt._parse(cli, self.full_name(".", lastsep=True), tokens[1:])
+            consumed = opt._parse(cli, self._path, tokens, i + 1)
             if self.helpfn and cli.ns(self.level)["help"]:
                 self.helpfn(self)
-            return tokens
+            return consumed
 
-        def set_defaults(self, cli):
+        def defaults(self):
             """
-            Set the options defaults for this level.
-            :param cli:
-            :return:
+            Return the options defaults of this level, in the order they are set.
+            :return: list of (option, value) tuples.
             """
-            assert isinstance(cli, CliResult)
-            cli.init_level(self.level)
+            out = []
             # if set, use longname as var name
             for o in self.longoptions.values():
                 val = o.default if (o.argtype is not None or o.default is not None) else False
-                cli[self.full_name(".", lastsep=True) + o.name] = val
-                cli.set_command_options(self.level, o.name, o, val)
+                out.append((o, val))
             # process options that have only short version
             for o in self.options.values():
                 if o not in self.longoptions.values():
-                    val = o.default if (o.argtype is not None or o.default is not None) else False
                     if o.default is not None:
-                        cli[self.full_name(".", lastsep=True) + o.name] = val
-                        cli.set_command_options(self.level, o.name, o, val)
+                        out.append((o, o.default))
+            return out
+
+        def default_namespaces(self):
+            """
+            Return the options defaults templates of this level. The templates are built once (per options set).
+            :return: (Namespace by full name, Namespace by option name)
+            """
+            if self._defaults_ns is None:
+                defaults = Namespace()
+                level_defaults = Namespace()
+                for o, val in self.defaults():
+                    defaults[self._path + o.name] = val
+                    level_defaults[o.name] = val
+                self._defaults_ns = (defaults, level_defaults)
+            return self._defaults_ns
+
+        def set_defaults(self, cli):
+            """
+            Set the options defaults for this level.
+            :param cli:
+            :return:
+            """
+            assert isinstance(cli, CliResult)
+            cli.init_level(self.level)
+            defaults, level_defaults = self.default_namespaces()
+            cli.add_defaults(self.level, defaults, level_defaults)
 
     class ArgType(object):
         """
@@ -510,7 +1062,9 @@ class MultiLevelCliBase(object):
         In most cases this shouldn't be used directly.
         argtype is either a terminal type: int, str, float, etc., array [], or struct {}.
         Nested types are supported. For example [ { key1 : int, key2 : str, key2 : [int] } ]
+        The type is compiled into the convert function when the argument is created (see compile()).
         """
+        __slots__ = ("name", "argtype", "description", "parent", "convert")
 
         def check_type(self, argtype):
             assert isinstance(argtype, (type, list, dict, MultiLevelCliBase.ArgType))
@@ -524,21 +1078,39 @@ class MultiLevelCliBase(object):
             self.check_type(self.argtype)
             self.description = description
             self.parent = parent
+            self.convert = self.compile()
+
+        def compile(self):
+            """
+            :return: the converter of the argument tokens: fn(token) -> value.
+            """
+            if isinstance(self.argtype, MultiLevelCliBase.ArgType):
+                return self.argtype.convert
+            return _Scalar.compile(self.argtype, self)
+
+        def _value(self, arg):
+            """
+            Convert the given token to the argument type.
+            :param arg: the argument token, or '@path' to read the value from a file (see _ValueFile).
+            :return: the converted value.
+            """
+            if arg.startswith("@"):
+                return _ValueFile.value(self, arg)
+            return self.convert(arg)
+
+        def _literal_type(self):
+            """
+            :return: the list/struct type of the value, None for scalars.
+            """
+            if isinstance(self.argtype, MultiLevelCliBase.ArgType):
+                return self.argtype._literal_type()
+            return None
 
         def _parse(self, cli, arg):
             assert isinstance(cli, CliResult)
-            try:
-                if isinstance(self.argtype, MultiLevelCliBase.ArgType):
-                    nested = CliResult()
-                    self.argtype._parse(nested, arg)
-                    val = nested.args()[self.argtype.name]
-                else:
-                    val = (self.argtype)(MultiLevelCliBase.strip(arg))
-                cli[self.full_name(".", lastsep=True) + self.name] = val
-                cli.add_command_arg(self, val)
-            except Exception:
-                raise ArgumentTypeError("Parse error at token '%s' [arg %s], can't convert to type %s" % (
-                    arg, self.full_name(".", lastsep=True) + self.name, self.argtype))
+            val = self._value(arg)
+            cli[self.full_name(".", lastsep=True) + self.name] = val
+            cli.add_command_arg(self, val)
             return 1  # consume only optname
 
         def full_name(self, sep, lastsep=True):
@@ -553,9 +1125,11 @@ class MultiLevelCliBase(object):
 
 
     @staticmethod
-    def nested_type(name, parent, argtype):
+    def nested_type(name, parent, argtype, packed=False):
         if type(argtype) == list:
-            return MultiLevelCliBase.ListType(name + ".array", parent, argtype)
+            return MultiLevelCliBase.ListType(name + ".array", parent, argtype, packed=packed)
+        if packed:
+            raise ParseExecption("%s: only lists of int or float can be packed, not %s" % (name, argtype))
         if type(argtype) == dict:
             return MultiLevelCliBase.StructType(name + ".struct", parent, argtype)
         else:
@@ -565,41 +1139,91 @@ class MultiLevelCliBase(object):
         """
         An object representing a list command argument.
         In most cases this shouldn't be used directly.
+        A packed list of int or float is an array.array (typecode 'q' or 'd') that is converted in bulk, instead of a
+        list of python objects. It supports the buffer protocol, e.g. numpy.frombuffer() makes a NumPy array of it
+        without copying.
         """
-        def __init__(self, name, parent, argtype, description=None):
+        __slots__ = ("_element",    # the compiled element type
+                     "typecode")    # the array.array typecode of a packed list, None for python lists
+        typecodes = {int: "q", float: "d"}
+
+        def __init__(self, name, parent, argtype, description=None, packed=False):
             assert isinstance(argtype, list)
             if not argtype:
                 argtype = str   # arrays of sting
             elif len(argtype) > 1:
                 raise ArgumentTypeError("ListType: multiple types in array are not supported for token '%s' - '%s'" % (name, argtype))
             argtype = MultiLevelCliBase.nested_type(name, self, argtype[0])
+            self._element = argtype if isinstance(argtype, MultiLevelCliBase.ArgType) else _Scalar.compile(argtype, self)
+            self.typecode = None
+            if packed:
+                if not isinstance(argtype, type) or argtype not in self.typecodes:
+                    raise ParseExecption("%s: only lists of int or float can be packed, not [%s]" % (name, argtype))
+                self.typecode = self.typecodes[argtype]
             MultiLevelCliBase.ArgType.__init__(self, name, parent, argtype, description)
 
-        def _parse(self, cli, arglist):
-            assert isinstance(cli, CliResult)
+        def compile(self):
+            return self._convert
+
+        def _literal_type(self):
+            return self
+
+        def _literal(self, parser, pos, end):
+            return parser.list(self, pos, end)
+
+        def _read(self, parser, pos, end):
+            return parser.nested(self, pos, end)
+
+        def _coerce(self, value):
+            if not isinstance(value, list):
+                raise ArgumentTypeError("ListType: Parse error at JSON value '%s' [arg %s], not a list" % (
+                    json.dumps(value), self.full_name(".", lastsep=True) + self.name))
+            if self.typecode is not None and not any(v is True or v is False for v in value):
+                try:
+                    return array.array(self.typecode, value)
+                except TypeError:
+                    pass    # not all numbers of the type, converted one by one
+            coerce = self._element._coerce
+            return self._pack([coerce(v) for v in value])
+
+        def _pack(self, values):
+            """
+            :return: the values as is, or packed for a packed list.
+            """
+            if self.typecode is None:
+                return values
+            try:
+                return array.array(self.typecode, values)
+            except OverflowError as e:
+                raise ArgumentTypeError("ListType: Parse error [arg %s], %s" % (
+                    self.full_name(".", lastsep=True) + self.name, e))
+
+        def _parse_literal(self, text):
+            """
+            Parse a list literal (see _LiteralParser). The elements of a packed list are first converted in bulk, and
+            only if this fails (e.g. quoted or empty elements) the literal is parsed element by element.
+            """
+            if self.typecode is not None:
+                start = text.find('[')
+                end = text.rfind(']')
+                if 0 <= start < end and not text[:start].strip() and not text[end + 1:].strip():
+                    try:
+                        return array.array(self.typecode, map(self._element.type, text[start + 1:end].split(",")))
+                    except (ValueError, OverflowError):
+                        pass
+            return self._pack(_LiteralParser(text).parse(self))
+
+        def _convert(self, arglist):
             arglist = str(arglist).strip()
             #print ("-> '" + arglist + "'")
             if not arglist.startswith('[') or not arglist.endswith(']'):
                 raise ArgumentTypeError("ListType: Parse error at token '%s' arg [arg %s] must conform to '[v1, v2,...]' format" % (
                     arglist, self.full_name(".", lastsep=True) + self.name))
-            arglist = arglist[1:-1] # remove  [ ]
+            return self._parse_literal(arglist)
 
-            args = MultiLevelCliBase.tokenize(arglist, sep=[','])
-            array = []
-            for arg in args:
-                try:
-                    if isinstance(self.argtype, MultiLevelCliBase.ArgType):
-                        nested = CliResult()
-                        self.argtype._parse(nested, arg)
-                        val = nested.args()[self.argtype.name]
-                    else:
-                        val = (self.argtype)(MultiLevelCliBase.strip(arg))
-                    array.append(val)
-                except Exception as e:
-                    if isinstance(e, ParseExecption):
-                        raise
-                    raise ArgumentTypeError("ListType: Parse error at token '%s' [arg %s], can't convert to type %s" % (
-                        arg, self.full_name(".", lastsep=True) + self.name, self.argtype))
+        def _parse(self, cli, arglist):
+            assert isinstance(cli, CliResult)
+            array = self._value(arglist)
             # update the result cli structures only if I am not neseted arg
             cli[self.full_name(".", lastsep=True) + self.name] = array
             cli.add_command_arg(self, array)
@@ -617,6 +1241,8 @@ class MultiLevelCliBase(object):
         An object representing a struct (dict) command argument.
         In most cases this shouldn't be used directly.
         """
+        __slots__ = ("_fields",)    # the compiled field types, by key
+
         def __init__(self, name, parent, argtype, description=None):
             assert isinstance(argtype, dict)
             if not type(argtype) == dict:
@@ -624,44 +1250,50 @@ class MultiLevelCliBase(object):
             # handle nested types
             for k in argtype:
                 argtype[k] = MultiLevelCliBase.nested_type(name, self, argtype[k])
+            self._fields = dict((k, t if isinstance(t, MultiLevelCliBase.ArgType) else _Scalar.compile(t, self))
+                                for k, t in argtype.items())
             MultiLevelCliBase.ArgType.__init__(self, name, parent, argtype, description)
 
-        def _parse(self, cli, arglist):
-            assert isinstance(cli, CliResult)
+        def compile(self):
+            return self._convert
+
+        def _literal_type(self):
+            return self
+
+        def _literal(self, parser, pos, end):
+            return parser.struct(self, pos, end)
+
+        def _read(self, parser, pos, end):
+            return parser.nested(self, pos, end)
+
+        def _coerce(self, value):
+            if not isinstance(value, dict):
+                raise ArgumentTypeError("StructType: Parse error at JSON value '%s' [arg %s], not an object" % (
+                    json.dumps(value), self.full_name(".", lastsep=True) + self.name))
+            fields = self._fields
+            struct = Namespace()
+            for k, v in value.items():
+                field = fields.get(k)
+                if field is None:
+                    raise ArgumentKeyError("StructType: Parse error at JSON value [arg %s], unknown key '%s'" % (
+                        self.full_name(".", lastsep=True) + self.name, k))
+                struct[k] = field._coerce(v)
+            return struct
+
+        def _convert(self, arglist):
             arglist = str(arglist).strip()
             #print ("-> '" + arglist + "'")
             if not arglist.startswith('{') or not arglist.endswith('}'):
                 raise ArgumentTypeError("ListType: Parse error at token '%s' arg [arg %s] must conform to '{k1=v1, k2=v2,...}' format" % (
                     arglist, self.parent.full_name(".", lastsep=True) + self.name))
-            arglist = arglist[1:-1] # remove  { }
+            return self._parse_literal(arglist)
 
-            args = MultiLevelCliBase.tokenize(arglist, sep=[','])
-            struct = Namespace()
-            for arg in args:
-                try:
-                    keyval = MultiLevelCliBase.tokenize(arg, sep=['='])
-                    if len(keyval) != 2:
-                        raise ArgumentTypeError(
-                            "ListType: Parse error at token '%s' [arg %s], can not parse 'key = value' (%s)" % (
-                                arg, self.parent.full_name(".", lastsep=True) + self.name, keyval))
-                    k = MultiLevelCliBase.strip(keyval[0])
-                    if not k in self.argtype:
-                        raise ArgumentKeyError(
-                            "ListType: Parse error at token '%s' [arg %s], unknown key '%s' " % (
-                                arg, self.parent.full_name(".", lastsep=True) + self.name, k))
-                    arg = MultiLevelCliBase.strip(keyval[1])
-                    if isinstance(self.argtype[k], MultiLevelCliBase.ArgType):
-                        nested = CliResult()
-                        self.argtype[k]._parse(nested, arg)
-                        val = nested.args()[self.argtype[k].name]
-                    else:
-                        val = (self.argtype[k])(str(arg).strip())
-                    struct[k] = (val)
-                except Exception as e:
-                    if isinstance(e, ParseExecption):
-                        raise
-                    raise ArgumentTypeError("ListType: Parse error at token '%s' [arg %s], can't parse to type %s" % (
-                        arg, self.parent.full_name(".", lastsep=True) + self.name, self.argtype))
+        def _parse_literal(self, text):
+            return _LiteralParser(text).parse(self)
+
+        def _parse(self, cli, arglist):
+            assert isinstance(cli, CliResult)
+            struct = self._value(arglist)
             cli[self.full_name(".", lastsep=True) + self.name] = struct
             cli.add_command_arg(self, struct)
             return 1  # consume only optname
@@ -688,7 +1320,9 @@ class MultiLevelCliBase(object):
         In most cases this shouldn't be used directly.
         @see MultiLevelCliBase.ParseBase.add_option()
         """
-        def __init__(self, short, long, parent, name=None, default=None, opttype=None, description=None):
+        __slots__ = ("parent", "name", "short", "long", "argtype", "description", "default", "convert")
+
+        def __init__(self, short, long, parent, name=None, default=None, opttype=None, description=None, packed=False):
             assert not short or isinstance(short, (str,unicode))
             assert not long or isinstance(long, (str,unicode))
             assert short or long
@@ -700,21 +1334,46 @@ class MultiLevelCliBase(object):
             self.name = name
             self.short = short
             self.long = long
-            self.argtype = MultiLevelCliBase.nested_type(self.name, self, opttype)
+            self.argtype = MultiLevelCliBase.nested_type(self.name, self, opttype, packed=packed)
             self.description = description
             self.default = default
+            # the option parameter converter, compiled once
+            if isinstance(self.argtype, MultiLevelCliBase.ArgType):
+                self.convert = self.argtype.convert
+            elif self.argtype is not None:
+                self.convert = _Scalar.compile(self.argtype, self)
+            else:
+                self.convert = None
 
-        def _parse(self, cli, path, tokens):
+        def _value(self, token):
+            """
+            Convert the given option parameter token to the option type.
+            :param token: the parameter token (the one after the option name), or '@path' (see _ValueFile).
+            :return: the converted value.
+            """
+            if token.startswith("@"):
+                return _ValueFile.value(self, token)
+            return self.convert(token)
+
+        def _literal_type(self):
+            if isinstance(self.argtype, MultiLevelCliBase.ArgType):
+                return self.argtype._literal_type()
+            return None
+
+        def _parse(self, cli, path, tokens, i):
+            """
+            Set the option value in the cli result.
+            :param cli: the CLI result object.
+            :param path: the full name prefix of the option level.
+            :param tokens: the command line tokens.
+            :param i: the index of the token following the option name (the option parameter if any).
+            :return: The number of tokens consumed.
+            """
             var = path + self.name
             assert isinstance(cli, CliResult)
             if self.argtype != None:
-                if isinstance(self.argtype, MultiLevelCliBase.ArgType):
-                    nested = CliResult()
-                    self.argtype._parse(nested, tokens[0])
-                    val = nested.args()[self.argtype.name]
-                else:
-                    val = (self.argtype)(MultiLevelCliBase.strip(tokens[0]))
-                #debug("name %s - arg %s" % (var, tokens[0]))
+                val = self._value(tokens[i])
+                #debug("name %s - arg %s" % (var, tokens[i]))
                 cli[var] = val
                 cli.set_command_options(self.parent.level, self.name, self, val)
                 return 2 # consume 2 tokens - optname and arg
@@ -728,7 +1387,9 @@ class MultiLevelCliBase(object):
 
 
     class GroupType(ParseBase):
-        def __init__(self, name, parent=None, description=None, defaultfn=None, helpfn=None):
+        __slots__ = ("commands", "groups", "defaultfn", "loader")
+
+        def __init__(self, name, parent=None, description=None, defaultfn=None, helpfn=None, loader=None):
             """
             Base CLI group class.
             :param name: the name of the group - used as parse token
@@ -737,28 +1398,47 @@ class MultiLevelCliBase(object):
             :param defaultfn: function to call if no command is triggered. Fn must be fn(MultiLevelCliBase.GroupType).
             :param help: insert help options by default? If not set, the -h/--help are not added and the help flags are
                     not handled. The user can still define it and handle it manually.
+            :param loader: optional fn(MultiLevelCliBase.GroupType) that adds the group content (sub groups, commands,
+                    options). It is called only once, when the group is first used (see materialize()).
             """
             assert isinstance(name, (str,unicode))
+            assert loader is None or callable(loader)
             self.commands = {}
             self.groups = {}
             self.defaultfn = defaultfn
+            self.loader = loader
             MultiLevelCliBase.ParseBase.__init__(self, name, parent, description, helpfn=helpfn)
 
+        def materialize(self):
+            """
+            Build the group content by calling the group loader (if any and if it wasn't called yet).
+            It is called when a parse or help request enters the group, or the group content is looked up.
+            :return:
+            """
+            loader = self.loader
+            if loader is not None:
+                self.loader = None
+                debug("Load group '%s'", self.name)
+                loader(self)
+
         def __contains__(self, name):
+            self.materialize()
             return name in self.groups or name in self.commands
 
         def __getitem__(self, item):
+            self.materialize()
             if item in self.groups:
                 return self.groups[item]
             else:
                 return self.commands[item]
 
-        def add_option(self, short, long = None, name=None, type=None, description=None, default=None):
+        def add_option(self, short, long = None, name=None, type=None, description=None, default=None, packed=False):
             assert not short or not short in self.groups
             assert not long or not long in self.groups
             assert not short or not short in self.commands
             assert not long or not long in self.commands
-            MultiLevelCliBase.ParseBase.add_option(self, short, long = long, name=name, type=type, description=description, default=default)
+            MultiLevelCliBase.ParseBase.add_option(self, short, long = long, name=name, type=type, description=description, default=default,
+                                                   packed=packed)
             assert not self.name in self.groups
             assert not self.name in self.commands
 
@@ -787,6 +1467,7 @@ class MultiLevelCliBase(object):
                     return ""
                 return ". Default '%s'" % str(d)
 
+            self.materialize()
             width = MultiLevelCliBase.helpwidth
             s = "Usage: %s %s" % (MultiLevelCliBase.prog, self.full_name())
             for o in self.options.values():
@@ -843,6 +1524,7 @@ class MultiLevelCliBase(object):
             :param description: used for help/usage screens.
             :return: The new argument object.
             """
+            self.check_mutable()
             return self.__add_command(MultiLevelCliBase.CommandType(name, parent=self, description=description, helpfn=help, ctx=ctx))
 
         def __add_command(self, cmd):
@@ -852,15 +1534,18 @@ class MultiLevelCliBase(object):
             self.commands[cmd.name] = cmd
             return cmd
 
-        def add_group(self, name, description=None, defaultfn=usage_and_exit, help=_defhelpfn):
+        def add_group(self, name, description=None, defaultfn=usage_and_exit, help=_defhelpfn, loader=None):
             """
             Add a new sub group to the current group.
             :param name: The name of the command for parsing and as the namespace target.
             :param description: used for help/usage screens.
             :param defaultfn: triggered if no command is found during the parsing (see __init__)
+            :param loader: optional fn(group) to build the group content on first use (lazy group, see __init__)
             :return: the new group object.
             """
-            return self.__add_group(MultiLevelCliBase.GroupType(name, self, description=description, defaultfn=defaultfn, helpfn=help))
+            self.check_mutable()
+            return self.__add_group(MultiLevelCliBase.GroupType(name, self, description=description, defaultfn=defaultfn,
+                                                                helpfn=help, loader=loader))
 
         def __add_group(self, group):
             assert isinstance(group, MultiLevelCliBase.GroupType)
@@ -875,6 +1560,7 @@ class MultiLevelCliBase(object):
             :param tab: tab level.
             :return:
             """
+            self.materialize()
             self.show(tab)
             for cmd in self.commands:
                 self.commands[cmd].show(tab+1)
@@ -889,36 +1575,58 @@ class MultiLevelCliBase(object):
             """
             print ("\t" * tab + "[%s]    %s" % (self.name, "- %s" % self.description if self.description else ""))
 
-        def _parse(self, cli, tokens):
+        def _parse(self, cli, tokens, i=0):
+            """
+            Parse the tokens starting at index i, where the group token itself was already consumed.
+            The tree is walked with a single cursor over the tokens: every level consumes its own options and
+            returns the next level (sub group or command) instead of recursing into it.
+            :param cli: the CLI result object.
+            :param tokens: the command line tokens.
+            :param i: the index of the first token to parse.
+            :return: the index after the last parsed token.
+            """
             assert isinstance(cli, CliResult)
             assert isinstance(tokens, list)
+            levels = [self]     # the entered levels stack
+            while levels[-1] is not None:
+                i, next_level = levels[-1]._parse_level(cli, tokens, i)
+                levels.append(next_level)
+            return i
+
+        def _parse_level(self, cli, tokens, i):
+            """
+            Parse the group level tokens starting at index i.
+            :return: (index, level) - the index after the parsed tokens and the entered sub group or command, or
+                    None if all the tokens were parsed.
+            """
             # posix parsing - all options are before commands in every level
+            self.materialize()
             cli.set_group(self)
             self.set_defaults(cli)
-            i = 0
-            while i < len(tokens):
+            n = len(tokens)
+            while i < n:
                 t = tokens[i]
                 assert isinstance(t, (str,unicode))
                 if t.startswith("--"):
-                    i += self.parse_option(cli, t[2:], tokens[i:], long=True)
+                    i += self.parse_option(cli, t[2:], tokens, i, long=True)
                 elif t.startswith("-"):
-                    i += self.parse_option(cli, t[1:], tokens[i:], long=False)
+                    i += self.parse_option(cli, t[1:], tokens, i, long=False)
                     # expect group name or command by that order
                 elif t in self.groups:
-                    i += self.groups[t]._parse(cli, tokens[i + 1:])
-                    continue
+                    return i + 1, self.groups[t]
                 elif t in self.commands:
-                    i += self.commands[t]._parse(cli, tokens[i + 1:])
-                    continue
+                    return i + 1, self.commands[t]
                 else:
                     cli.set_unparsed_tokens(tokens[i:])
                     raise UnknownToken("Parse error at %s token '%s'" % (self.full_name("."), t))
-            return 1 + i # one token for the group token
+            return i, None
 
     class CommandType(ParseBase):
         """
         A (sub) command. Generated by group.add_command()
         """
+        __slots__ = ("__arguments", "__ctx")
+
         def __init__(self, name, parent, description=None, helpfn=None, ctx=None):
             assert isinstance(name, (str,unicode))
             assert isinstance(parent, MultiLevelCliBase.GroupType)
@@ -926,25 +1634,42 @@ class MultiLevelCliBase(object):
             self.__arguments = []
             self.__ctx = ctx    # user defined ctx
 
-        def _add_argument(self, name, argtype=str, description=None):
+        def arguments(self):
+            """
+            Returns the command arguments (in positional order).
+            :return: list of ArgType objects.
+            """
+            return self.__arguments
+
+        def ctx(self):
+            """
+            Returns the user defined command context.
+            """
+            return self.__ctx
+
+        def _add_argument(self, name, argtype=str, description=None, packed=False):
+            self.check_mutable()
             if type(argtype) is list:
                 return self.__add_argument(
-                    MultiLevelCliBase.ListType(name, self, argtype=argtype, description=description))
+                    MultiLevelCliBase.ListType(name, self, argtype=argtype, description=description, packed=packed))
+            if packed:
+                raise ParseExecption("%s: only lists of int or float can be packed, not %s" % (self.full_name(), argtype))
             if type(argtype) is dict:
                 return self.__add_argument(MultiLevelCliBase.StructType(name, self, argtype=argtype, description=description))
             if type(argtype) is type:
                 return self.__add_argument(MultiLevelCliBase.ArgType(name, self, type=argtype, description=description))
             raise ParseExecption("%s: unknown type: %s" % (self.full_name(),argtype))
 
-        def add_argument(self, name, type=str, description=None):
+        def add_argument(self, name, type=str, description=None, packed=False):
             """
             Add a new (mandatory) argument for the current command.
             :param name: to be used as the namespace target.
             :param type: python type that converted from string.
             :param description: used by help/usage screeds.
+            :param packed: for [int] or [float] types, the value is a packed array.array (see ListType).
             :return: The new argument.
             """
-            return self._add_argument(name, argtype=type, description=description)
+            return self._add_argument(name, argtype=type, description=description, packed=packed)
 
         def __add_argument(self, arg):
             assert isinstance(arg, MultiLevelCliBase.ArgType)
@@ -960,37 +1685,37 @@ class MultiLevelCliBase(object):
             """
             print ("\t" * tab + "%s %s" % (self.name, "- %s" % self.description if self.description else ""))
 
-        def _parse(self, cli, tokens):
-            assert isinstance(cli, CliResult)
-            assert isinstance(tokens, list)
+        def _parse_level(self, cli, tokens, i):
+            """
+            Parse the command tokens (options and arguments) starting at index i.
+            :return: (index, None) - a command is always the last level.
+            """
             self.set_defaults(cli)
             cli.set_command(self, self.__ctx)
             # posix parsing - all options are before commands in every level
             argnum = 0
-            i = 0
-            while i < len(tokens):
-                consumed = 0
+            n = len(tokens)
+            while i < n:
                 t = tokens[i]
                 assert isinstance(t, (str,unicode))
                 if t.startswith("--"):
-                    consumed += self.parse_option(cli, t[2:], tokens[i:], long=True)
+                    i += self.parse_option(cli, t[2:], tokens, i, long=True)
                 elif t.startswith("-"):
-                    consumed += self.parse_option(cli, t[1:], tokens[i:], long=False)
+                    i += self.parse_option(cli, t[1:], tokens, i, long=False)
                     # expect group name or command by that order
                 elif argnum < len(self.__arguments):
                     arg = self.__arguments[argnum]
                     assert isinstance(arg, MultiLevelCliBase.ArgType)
-                    consumed += arg._parse(cli, t)
+                    i += arg._parse(cli, t)
                     argnum += 1
                 else:
                     cli.set_unparsed_tokens(tokens[i:])
                     raise UnknownToken("Parse error at %s token '%s'" % (self.full_name("."), t))
-                i += consumed
 
             # check that all arguments are provided!
             if argnum < len(self.__arguments):
                 raise CommandMissingArguments("Command %s requires more arguments than provided (provided arguments - %d)" % (self.full_name("."), argnum))
-            return 1 + i  # one for the command token itself
+            return i, None
 
         def fill_description(self, name : str, type_str : str, desc : str, default_str: str):
             if not desc or not isinstance(desc, str):
@@ -1072,6 +1797,187 @@ class MultiLevelCliBase(object):
             return out
 
 
+class DispatchTable(object):
+    """
+    An immutable, flat parsing table compiled from a (frozen) cli tree. See MultiLevelArgParse.freeze().
+    Each tree node (group or command) gets a node id and a token->action map, where option tokens are kept
+    with their dashes ("-x", "--long"), so a known token costs a single dict lookup. The target variable
+    names of options, defaults and arguments are precomputed.
+    Lazy groups (see GroupType.materialize()) that were not loaded yet are not compiled. Their subtree is loaded
+    and compiled into a table of its own when the parsing first enters them.
+    """
+    OPTION = 0
+    GROUP = 1
+    COMMAND = 2
+    LAZY = 3
+
+    # node: the tree object, actions: token -> action tuple, defaults: the node default_namespaces(),
+    # args: ((arg, var),...), path: the dotted full name, optprefix: the option prefix used in error messages.
+    Node = namedtuple("Node", ["node", "level", "command", "actions", "defaults", "args", "path", "optprefix"])
+
+    def __init__(self, root):
+        assert isinstance(root, MultiLevelCliBase.GroupType)
+        nodes = []
+        ids = {root: 0}
+        pending = [root]
+        for node in pending:    # breadth first - pending grows while iterating
+            node._frozen = True
+            actions = {}
+            if isinstance(node, MultiLevelCliBase.GroupType):
+                for child in list(node.groups.values()) + list(node.commands.values()):
+                    if isinstance(child, MultiLevelCliBase.GroupType) and child.loader is not None:
+                        actions[child.name] = (DispatchTable.LAZY, child)
+                        continue
+                    ids[child] = len(ids)
+                    pending.append(child)
+                    kind = DispatchTable.GROUP if child.name in node.groups else DispatchTable.COMMAND
+                    actions[child.name] = (kind, ids[child])
+            nodes.append(self.__compile_node(node, actions))
+        self.__nodes = tuple(nodes)
+        self.__lazy = {}    # lazy group -> its DispatchTable, compiled on first use
+
+    def __compile_node(self, node, actions):
+        path = node.full_name(".", lastsep=True)
+        for short, o in node.options.items():
+            actions["-" + short] = (DispatchTable.OPTION, o, path + o.name, node.helpfn is not None)
+        for long, o in node.longoptions.items():
+            actions["--" + long] = (DispatchTable.OPTION, o, path + o.name, node.helpfn is not None)
+        defaults = node.default_namespaces()
+        command = isinstance(node, MultiLevelCliBase.CommandType)
+        args = tuple((a, path + a.name) for a in node.arguments()) if command else ()
+        optprefix = node.parent.full_name(".", lastsep=True) if node.parent else ""
+        return DispatchTable.Node(node, node.level, command, MappingProxyType(actions), defaults, args,
+                                  node.full_name("."), optprefix)
+
+    def __len__(self):
+        return len(self.__nodes)
+
+    def __subtable(self, group):
+        table = self.__lazy.get(group)
+        if table is None:
+            group.materialize()
+            table = self.__lazy[group] = DispatchTable(group)
+        return table
+
+    def __getitem__(self, node_id):
+        return self.__nodes[node_id]
+
+    @staticmethod
+    def __enter(cli, entry):
+        if not entry.command:
+            cli.set_group(entry.node)
+        cli.init_level(entry.level)
+        cli.add_defaults(entry.level, *entry.defaults)
+        if entry.command:
+            cli.set_command(entry.node, entry.node.ctx())
+
+    def parse(self, cli, tokens):
+        """
+        Parse the tokens into the given cli result object. Same semantics as the tree parsing.
+        :param cli: the CliResult object to fill.
+        :param tokens: list of string tokens.
+        :return: the number of consumed tokens.
+        """
+        assert isinstance(cli, CliResult)
+        nodes = self.__nodes
+        entry = nodes[0]
+        self.__enter(cli, entry)
+        argnum = 0
+        i = 0
+        n = len(tokens)
+        while i < n:
+            t = tokens[i]
+            action = entry.actions.get(t)
+            if action is not None:
+                kind = action[0]
+                if kind == DispatchTable.OPTION:
+                    kind, o, var, help = action
+                    if o.argtype is not None:
+                        if i + 1 >= n:
+                            raise OptionNoParam("Option %s requires a parameter" % t.lstrip("-"))
+                        val = o._value(tokens[i + 1])
+                        i += 2
+                    else:
+                        val = not o.default
+                        i += 1
+                    cli[var] = val
+                    cli.set_command_options(entry.level, o.name, o, val)
+                    if help and cli.ns(entry.level)["help"]:
+                        entry.node.helpfn(entry.node)
+                    continue
+                if kind == DispatchTable.LAZY:
+                    # the rest of the tokens are parsed by the lazy group table
+                    nodes = self.__subtable(action[1]).__nodes
+                    action = (DispatchTable.GROUP, 0)
+                # a sub group or a command
+                entry = nodes[action[1]]
+                self.__enter(cli, entry)
+                argnum = 0
+                i += 1
+                continue
+            if t.startswith("-"):
+                optname = t[2:] if t.startswith("--") else t[1:]
+                raise OptionNotFound("Option %s%s not found" % (entry.optprefix, optname))
+            if argnum < len(entry.args):
+                arg, var = entry.args[argnum]
+                val = arg._value(t)
+                cli[var] = val
+                cli.add_command_arg(arg, val)
+                argnum += 1
+                i += 1
+                continue
+            cli.set_unparsed_tokens(tokens[i:])
+            raise UnknownToken("Parse error at %s token '%s'" % (entry.path, t))
+
+        # check that all arguments are provided!
+        if argnum < len(entry.args):
+            raise CommandMissingArguments("Command %s requires more arguments than provided (provided arguments - %d)" % (entry.path, argnum))
+        return i
+
+
+class _SnapshotGroup(object):
+    """
+    The loader of a top level group of a tree snapshot (see MultiLevelArgParse.save_snapshot()): the group content,
+    its sub groups and commands, is a pickle of its own that is loaded when the group is materialized. The nodes out
+    of the pickled part (the root and the group) and the command contexts (by their ctx keys) are saved as persistent
+    ids.
+    """
+    __slots__ = ("data", "root", "ctx_resolver")
+
+    def __init__(self, data, root, ctx_resolver):
+        self.data = data
+        self.root = root
+        self.ctx_resolver = ctx_resolver
+
+    def __call__(self, group):
+        group.groups, group.commands = _SnapshotGroup.loads(self.data, self.ctx_resolver, (self.root, group))
+
+    @staticmethod
+    def dumps(obj, ctx_keys, nodes=()):
+        node_ids = dict((id(node), i) for i, node in enumerate(nodes))
+
+        def persistent_id(o):
+            if isinstance(o, (str, int)):
+                return None
+            if id(o) in node_ids:
+                return ("node", node_ids[id(o)])
+            ctx = ctx_keys.get(id(o))
+            return None if ctx is None else ("ctx", ctx)
+
+        f = io.BytesIO()
+        p = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        if ctx_keys or nodes:
+            p.persistent_id = persistent_id
+        p.dump(obj)
+        return f.getvalue()
+
+    @staticmethod
+    def loads(data, ctx_resolver, nodes=()):
+        u = pickle.Unpickler(io.BytesIO(data))
+        u.persistent_load = lambda pid: nodes[pid[1]] if pid[0] == "node" else ctx_resolver(pid[1])
+        return u.load()
+
+
 class MultiLevelArgParse(MultiLevelCliBase.GroupType):
     """
     A Multi level command line parsing class.
@@ -1097,24 +2003,250 @@ class MultiLevelArgParse(MultiLevelCliBase.GroupType):
         MultiLevelCliBase.prog = prog
         self.description = description
         self._non_parsed = None
+        self._table = None
+        self._completions = None    # the completion index of a frozen tree
+
+    def freeze(self):
+        """
+        Compile the cli tree into an immutable DispatchTable that is used by all following parse() calls.
+        After freezing, no groups, commands, options or arguments can be added to the tree. Lazy groups that were
+        not loaded yet are loaded (and frozen) when the parsing first enters them.
+        :return: the DispatchTable.
+        """
+        if self._table is None:
+            self._table = DispatchTable(self)
+        return self._table
+
+    compile = freeze
+
+    def frozen(self):
+        return self._table is not None
+
+    snapshot_format = 5     # the snapshot file format version
+
+    def save_snapshot(self, path, key, ctx_key=None):
+        """
+        Save the fully built tree to a snapshot file (see load_snapshot()). Lazy groups are loaded first.
+        The content of each top level group is saved apart from the root, so it is loaded only when the group is used.
+        The groups/commands/options fns (defaultfn, help, types) are saved by reference, so they must be module level
+        objects.
+        :param path: the snapshot file path. The file is replaced atomically.
+        :param key: the snapshot key, e.g. a hash of the source the tree is built from.
+        :param ctx_key: optional fn(ctx) that returns a (picklable) key for a command user context. If set, the
+                contexts are saved as keys and restored by the load_snapshot() ctx_resolver.
+        :return:
+        """
+        ctx_keys = {}
+        pending = [self]
+        for node in pending:
+            if isinstance(node, MultiLevelCliBase.GroupType):
+                node.materialize()
+                pending.extend(node.groups.values())
+                pending.extend(node.commands.values())
+            elif ctx_key and node.ctx() is not None:
+                ctx_keys[id(node.ctx())] = ctx_key(node.ctx())
+
+        # the root is saved with empty top level groups, and then the content of each of them
+        names = tuple(self.groups)
+        contents = [(g.groups, g.commands) for g in self.groups.values()]
+        table, completions = self._table, self._completions   # these are not saved - they are rebuilt on load
+        try:
+            self._table = self._completions = None
+            for g in self.groups.values():
+                g.groups, g.commands = {}, {}
+            parts = [_SnapshotGroup.dumps(self, ctx_keys)]
+        finally:
+            self._table, self._completions = table, completions
+            for g, (groups, commands) in zip(self.groups.values(), contents):
+                g.groups, g.commands = groups, commands
+        for g, content in zip(self.groups.values(), contents):
+            parts.append(_SnapshotGroup.dumps(content, ctx_keys, (self, g)))
+        offsets = [0]
+        for part in parts:
+            offsets.append(offsets[-1] + len(part))
+
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(tmp, "wb") as f:
+                header = (MultiLevelArgParse.snapshot_format, key, table is not None, names, tuple(offsets))
+                pickle.Pickler(f, pickle.HIGHEST_PROTOCOL).dump(header)
+                for part in parts:
+                    f.write(part)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        debug("Saved snapshot '%s' key '%s' (%d nodes)", path, key, len(pending))
+
+    @staticmethod
+    def load_snapshot(path, key, ctx_resolver=None, prog=None):
+        """
+        Load a tree saved by save_snapshot(). Snapshot files are python pickles and must be trusted.
+        Only the root is loaded. The top level groups are lazy, their content (and its command contexts) is loaded when
+        the group is first used.
+        :param path: the snapshot file path.
+        :param key: the expected key. A snapshot saved with a different key (or format) is stale and ignored.
+        :param ctx_resolver: fn(key) that returns the command user context of the given ctx key (see ctx_key).
+        :param prog: the program name. If not set, the argv[0] is used.
+        :return: the MultiLevelArgParse object or None if there is no valid snapshot. Stale and corrupt snapshot files
+                are removed.
+        """
+        try:
+            with open(path, "rb") as f:
+                fmt, saved_key, frozen, names, offsets = pickle.Unpickler(f).load()
+                if fmt != MultiLevelArgParse.snapshot_format or saved_key != key:
+                    raise ParseExecption("stale snapshot (format %s key '%s')" % (fmt, saved_key))
+                data = memoryview(f.read())
+            if len(data) != offsets[-1]:
+                raise ParseExecption("truncated snapshot (%d of %d bytes)" % (len(data), offsets[-1]))
+            cli = _SnapshotGroup.loads(data[:offsets[1]], ctx_resolver)
+            if not isinstance(cli, MultiLevelArgParse):
+                raise ParseExecption("bad snapshot object %s" % type(cli))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            debug("Invalid snapshot '%s': %s", path, e)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        for i, name in enumerate(names, 1):
+            cli.groups[name].loader = _SnapshotGroup(data[offsets[i]:offsets[i + 1]], cli, ctx_resolver)
+        cli.name = sys.argv[0]
+        MultiLevelCliBase.prog = prog if prog else sys.argv[0]
+        if frozen:
+            cli.freeze()
+        return cli
+
+    def completion_index(self, base=None, words=()):
+        """
+        Build the completion index of the tree (see multilevelcli.complete). Lazy groups are loaded first.
+        :param base: optional MultiLevelArgParse whose root options are completed at the root level too, e.g. the main
+                options of a program that parses the rest of its command line by this tree.
+        :param words: optional extra root level words, e.g. the program modes.
+        :return: the index.
+        """
+        nodes = []
+        ids = {self: 0}
+        pending = [self]
+        for node in pending:    # breadth first, in the node ids order
+            trie = {}
+            for parent in [node] if node is not self or base is None else [base, node]:
+                for short, o in parent.options.items():
+                    complete.trie_add(trie, "-" + short, complete.FLAG if o.argtype is None else complete.VALUE)
+                for long, o in parent.longoptions.items():
+                    complete.trie_add(trie, "--" + long, complete.FLAG if o.argtype is None else complete.VALUE)
+            if isinstance(node, MultiLevelCliBase.GroupType):
+                node.materialize()
+                for child in list(node.groups.values()) + list(node.commands.values()):
+                    ids[child] = len(ids)
+                    pending.append(child)
+                    complete.trie_add(trie, child.name, ids[child])
+            nodes.append((trie, len(node.arguments()) if isinstance(node, MultiLevelCliBase.CommandType) else 0))
+        for word in words:
+            complete.trie_add(nodes[0][0], word, len(nodes))
+            nodes.append(({}, 0))
+        return tuple(nodes)
+
+    def complete(self, cmdline):
+        """
+        Complete the last word of the given command line: the groups and commands names, or the options (once a '-'
+        is typed) that may follow. The index of a frozen tree is built once.
+        :param cmdline: list of words, or a command line str that is split by white space. A line that ends with a
+                white space completes a new word.
+        :return: sorted list of completions.
+        """
+        if isinstance(cmdline, (str, unicode)):
+            words = cmdline.split()
+            if not cmdline or cmdline[-1].isspace():
+                words.append("")
+        else:
+            words = cmdline
+        index = self._completions
+        if index is None:
+            index = self.completion_index()
+            if self.frozen():
+                self._completions = index
+        return complete.complete(index, words)
+
+    def save_completion_index(self, path, base=None, words=()):
+        """
+        Save the completion index to a file that is used by the completion scripts (see completion_script()).
+        :param path: the index file path. The file is replaced atomically.
+        :param base: see completion_index().
+        :param words: see completion_index().
+        :return:
+        """
+        complete.save(path, self.completion_index(base, words))
+
+    completion_scripts = {
+        "bash": """# %(progs)s completion
+_%(fn)s() {
+    local IFS=$'\\n'
+    COMPREPLY=($(%(python)s -S -E -c %(code)s %(dir)s %(index)s "${COMP_WORDS[@]:1:COMP_CWORD}" 2>/dev/null))
+}
+complete -o default -F _%(fn)s %(progs)s
+""",
+        "zsh": """#compdef %(progs)s
+_%(fn)s() {
+    local -a completions
+    completions=("${(@f)$(%(python)s -S -E -c %(code)s %(dir)s %(index)s "${(@)words[2,CURRENT]}" 2>/dev/null)}")
+    if [[ -n "${completions[1]}" ]]; then
+        compadd -a completions
+    else
+        _files
+    fi
+}
+compdef _%(fn)s %(progs)s
+"""}
+
+    @staticmethod
+    def completion_script(progs, path, shell="bash"):
+        """
+        Generate a shell completion script. The script completes the command lines by the index file only (see
+        save_completion_index()), by the multilevelcli.complete module alone, without importing the package.
+        :param progs: the program name or list of names to complete.
+        :param path: the completion index file path.
+        :param shell: "bash" or "zsh".
+        :return: the script text, e.g. to be sourced by the shell rc file.
+        """
+        import shlex
+        if shell not in MultiLevelArgParse.completion_scripts:
+            raise ParseExecption("unsupported shell '%s', use one of %s" % (
+                shell, ", ".join(sorted(MultiLevelArgParse.completion_scripts))))
+        if isinstance(progs, (str, unicode)):
+            progs = [progs]
+        return MultiLevelArgParse.completion_scripts[shell] % dict(
+            progs=" ".join(shlex.quote(p) for p in progs), fn=re.sub(r"\W", "_", os.path.basename(progs[0])),
+            python=shlex.quote(sys.executable), code=shlex.quote(complete.entry_point),
+            dir=shlex.quote(os.path.dirname(os.path.abspath(complete.__file__))),
+            index=shlex.quote(os.path.abspath(os.path.expanduser(path))))
 
     def parse(self, cmdline=None, partial=False):
         '''
         Parse the given cmdline.
-        :param cmdline: the command line to parse. Can be string, arrays of string tokens, or None where the sys.argv is used.
+        :param cmdline: the command line to parse. Can be string, arrays of string tokens, or None where the sys.argv
+                is used. The sys.argv args are used as is (see MultiLevelCliBase.tokenize_argv()).
         :param partial: if True, unknown tokens will not cause exception, but rather can be retrieved using cli.unparsed_tokens().
         :return: CliResut (see @CliResult)
         '''
         cli = CliResult()
         if cmdline == None:
-            cmdline = " ".join(sys.argv[1:])
-        if isinstance(cmdline, (str,unicode)):
+            tokens = MultiLevelCliBase.tokenize_argv(sys.argv[1:])
+        elif isinstance(cmdline, (str,unicode)):
             tokens = MultiLevelCliBase.tokenize(cmdline)
         elif isinstance(cmdline, list):
             tokens = cmdline
 
         try:
-            consumed = self._parse(cli, tokens)
+            if self._table is not None:
+                consumed = self._table.parse(cli, tokens)
+            else:
+                consumed = self._parse(cli, tokens)
         except UnknownToken:
             if partial:
                 pass
@@ -1128,6 +2260,44 @@ class MultiLevelArgParse(MultiLevelCliBase.GroupType):
 
         return cli
 
+    def parse_many(self, lines, partial=False, nocommand=raise_no_command, stdin=True):
+        '''
+        Parse a batch of command lines, e.g. a file, stdin or a generator. The parsing doesn't stop on a bad line: the
+        line's parse error is returned in place of its result. The tokenizer and the parse engine (the tree or the
+        DispatchTable if the cli is frozen) are resolved once for the whole batch.
+        :param lines: iterable of command lines - strings or arrays of string tokens. Empty lines and lines that start
+                with '#' are skipped.
+        :param partial: see parse().
+        :param nocommand: fn(group) that is called for a line with no command, instead of the group defaultfn (that
+                usually prints the usage and exits). The default raises NoCommand. If None, such lines are accepted.
+        :param stdin: False if the lines are read from stdin, so '@-' values (that would read the following lines)
+                are rejected.
+        :return: generator of (line number, CliResult or ParseExecption). Line numbers start from 1.
+        '''
+        tokenizer = MultiLevelCliBase._tokenizer()
+        parse = self._table.parse if self._table is not None else self._parse
+        for lineno, line in enumerate(lines, 1):
+            if isinstance(line, (str,unicode)):
+                line = line.strip()
+                if not line or line[0] == '#':
+                    continue
+            cli = CliResult()
+            try:
+                _ValueFile.stdin = stdin
+                try:
+                    parse(cli, tokenizer(line) if isinstance(line, (str,unicode)) else line)
+                except UnknownToken:
+                    if not partial:
+                        raise
+                finally:
+                    _ValueFile.stdin = True
+                if nocommand and not cli.command():
+                    nocommand(cli.group())
+            except ParseExecption as e:
+                yield lineno, e
+                continue
+            yield lineno, cli
+
 
     def show_systax(self):
         print( """
@@ -1300,6 +2470,8 @@ def test_main():
     test_tokenize('one \"two "two-cont \"blah " \'three t3\'')
     test_tokenize('one \"two "two-cont \\"blah " \'three t3\'', ParseExecption)
     test_tokenize("arg1 'arg2 arg3' [{ a b c { d } } ] ']' two \"{\"{sfsf}")
+    test_tokenize("one\\ two [a, \\], b] 'c \\' d' e")
+    test_tokenize("one \t two\nthree   four ] }")
 
     # Test cli definitions
     cli = MultiLevelArgParse("demo cli", defaultfn=usage_and_raise_no_command, help=usage_and_raise_help)
@@ -1383,64 +2555,290 @@ def test_main():
     print (cli.usage())
     print("")
 
-    test_cmd(cli, "", NoCommand, "negative: usage (default handling) for empty cmdline")
-    test_cmd(cli, "-q", NoCommand, desc="usage (default handling) for first level no command")
-    test_cmd(cli, "-q --help", HelpRquired, desc="first level help generation")
-    test_cmd(cli, "list", desc="first level command no args")
-    test_cmd(cli, "-t 5 list", desc="first level opt with param and command")
-    test_cmd(cli, "class list", desc="second level command no args")
-    test_cmd(cli, "class list -l", desc="second level command opt parsing")
-    test_cmd(cli, "class list -l -h", HelpRquired, desc="second level command opt")
-    test_cmd(cli, "class -h list -l", HelpRquired, desc="second level option with second level command and option")
-    test_cmd(cli, "class", NoCommand, "negative: usage (default handling) for no (second level) command")
-    test_cmd(cli, "class new newclass", CommandMissingArguments, desc="negative: missing arguments for second level command")
-    test_cmd(cli, "class new newclass 8", desc="second level command with 2 arguments")
-    test_cmd(cli, "class new newclass --help", HelpRquired, desc="second level command help generation")
-    test_cmd(cli, "class new newclass -x 9 10", desc="second level command with options and arguments")
-    test_cmd(cli, "-q class new newclass -x 9 88", desc="root level option with second level option and argument")
-    test_cmd(cli, "-q class -t new newclass -x 9 --max_units 13 --min_units 7 100",
-             desc="root level option, first level option, second level command long and short options and arguments")
-
-    test_cmd(cli, "alpha -h ", NoCommand, desc="group help override")
-    test_cmd(cli, "alpha list -h ", NoCommand, desc="command help override")
-
-    test_cmd(cli, "beta -h ", OptionNotFound, desc="group help disable")
-    n = test_cmd(cli, "beta test", desc="check command ctx")
-    if n.command_ctx() != "context":
-        raise Exception("bad command context")
-
-    test_cmd(cli, "instance new newclass -x 9 --max_units 13 --min_units 7", OptionNotFound, desc="negative: bad second level option")
-    test_cmd(cli, "instance resize -h", HelpRquired, desc="generate help with option that is long only")
-    test_cmd(cli, "instance resize --force", desc="second level command with option that is long only")
-    test_cmd(cli, "instance new kuku def aa", ArgumentTypeError, desc="negative: bad second level command arguement type")
-    test_cmd(cli, "instance new kuku def 7", desc="second level command arguments with int type")
-    test_cmd(cli, "instance new kuku def 7 -h", HelpRquired, desc="help generation for second level command with arguments")
-    test_cmd(cli, "instance -h new kuku def 7 -h", HelpRquired, desc="help generation for first level while second level help is requested too")
-    test_cmd(cli, "--help instance -h new kuku def 7 -h", HelpRquired, desc="help generation for root level with first and second level help is requested too")
-    test_cmd(cli, "instance new kuku def 7 8", UnknownToken, desc="negative: unknown token at end of second level command")
-    n = test_cmd(cli, "instance new kuku def 7 8", partial=True, desc="partial second level parsing")
-    print ("Unparsed tokens: %s" % (n.unparsed_tokens()))
-    test_cmd(cli, "-q xxx new kuku def 7 8", NoCommand, partial=True, desc="negative: usage (default handling) for partial parsing and unknown command")
-
-    # Test list/dict args
-    test_cmd(cli, "instance info 1,2,3,4", ArgumentTypeError, desc="Negative bad list int arg")
-    test_cmd(cli, "instance info [1,2,3,4]", desc="list int arg")
-    test_cmd(cli, "instance info []", desc="list str arg")
-    test_cmd(cli, "instance info [6, 9]", desc="list str arg")
-    test_cmd(cli, "instance info [6, 9,    -1]", desc="list str arg")
-    test_cmd(cli, "instance info [6, 4, \"999 jjj\", \"kuku\"]", desc="list str arg")
-    test_cmd(cli, "instance info [6, 9] --ids [4, 5]", desc="list str arg and list int option")
-    test_cmd(cli, "instance info [6, 9] --complex [4, 5]", ArgumentTypeError, desc="negative: define nested array but use non nested array")
-    test_cmd(cli, "instance info [6, 9] --complex [[4, 5], [6,4,8], [4,5]]", desc="nested int arrays")
-    test_cmd(cli, "instance info [6, 9] --complexs [[4, 5], [6,4,8, bobob], [4,5]]", desc="nested str arrays")
-    test_cmd(cli, "instance info [6, 9] --complexst [ {key1 = bobo, key2 = 6 }, { key2 = 8} ]", desc="nested str arrays")
-    test_cmd(cli, "instance info [6, 9] --complexstar [ {key1 = bobo, key2 = 6 }, { key2 = 8, key3 = [ 5, 67, 0] } ]", desc="nested str arrays")
-    test_cmd(cli, "instance info [7] --cred { password = 'this is me', user = me, userid = 8}", desc="list str arg and struct option")
-    test_cmd(cli, "instance info [7] --cred { password = 'this ,is me', user = \" me=me\", userid = 8}", desc="list str arg and struct option with problematic chars")
-    test_cmd(cli, "instance info [7] --cred { password = 'this', user = me, userid = 8, stam=kuku}", ArgumentKeyError, desc="negative: unknown key")
-    test_cmd(cli, "instance set { password = 'this is me', user = me, userid = 8}", desc="struct arg")
-
-    test_cmd(cli, "instance check [ {key1 = bobo, key2 = 6 }, { key2 = 8, key3 = [ 5, 67, 0] } ]", desc="nested str arrays arg")
+    # run all parse tests on the tree and then again on the frozen dispatch table
+    for frozen in (False, True):
+        if frozen:
+            cli.freeze()
+        test_cmd(cli, "", NoCommand, "negative: usage (default handling) for empty cmdline")
+        test_cmd(cli, "-q", NoCommand, desc="usage (default handling) for first level no command")
+        test_cmd(cli, "-q --help", HelpRquired, desc="first level help generation")
+        test_cmd(cli, "list", desc="first level command no args")
+        test_cmd(cli, "-t 5 list", desc="first level opt with param and command")
+        test_cmd(cli, "class list", desc="second level command no args")
+        test_cmd(cli, "class list -l", desc="second level command opt parsing")
+        test_cmd(cli, "class list -l -h", HelpRquired, desc="second level command opt")
+        test_cmd(cli, "class -h list -l", HelpRquired, desc="second level option with second level command and option")
+        test_cmd(cli, "class", NoCommand, "negative: usage (default handling) for no (second level) command")
+        test_cmd(cli, "class new newclass", CommandMissingArguments, desc="negative: missing arguments for second level command")
+        test_cmd(cli, "class new newclass 8", desc="second level command with 2 arguments")
+        test_cmd(cli, "class new newclass --help", HelpRquired, desc="second level command help generation")
+        test_cmd(cli, "class new newclass -x 9 10", desc="second level command with options and arguments")
+        test_cmd(cli, "-q class new newclass -x 9 88", desc="root level option with second level option and argument")
+        test_cmd(cli, "-q class -t new newclass -x 9 --max_units 13 --min_units 7 100",
+                 desc="root level option, first level option, second level command long and short options and arguments")
+
+        test_cmd(cli, "alpha -h ", NoCommand, desc="group help override")
+        test_cmd(cli, "alpha list -h ", NoCommand, desc="command help override")
+
+        test_cmd(cli, "beta -h ", OptionNotFound, desc="group help disable")
+        n = test_cmd(cli, "beta test", desc="check command ctx")
+        if n.command_ctx() != "context":
+            raise Exception("bad command context")
+
+        test_cmd(cli, "instance new newclass -x 9 --max_units 13 --min_units 7", OptionNotFound, desc="negative: bad second level option")
+        test_cmd(cli, "instance resize -h", HelpRquired, desc="generate help with option that is long only")
+        test_cmd(cli, "instance resize --force", desc="second level command with option that is long only")
+        test_cmd(cli, "instance new kuku def aa", ArgumentTypeError, desc="negative: bad second level command arguement type")
+        test_cmd(cli, "instance new kuku def 7", desc="second level command arguments with int type")
+        test_cmd(cli, "instance new kuku def 7 -h", HelpRquired, desc="help generation for second level command with arguments")
+        test_cmd(cli, "instance -h new kuku def 7 -h", HelpRquired, desc="help generation for first level while second level help is requested too")
+        test_cmd(cli, "--help instance -h new kuku def 7 -h", HelpRquired, desc="help generation for root level with first and second level help is requested too")
+        test_cmd(cli, "instance new kuku def 7 8", UnknownToken, desc="negative: unknown token at end of second level command")
+        n = test_cmd(cli, "instance new kuku def 7 8", partial=True, desc="partial second level parsing")
+        print ("Unparsed tokens: %s" % (n.unparsed_tokens()))
+        test_cmd(cli, "-q xxx new kuku def 7 8", NoCommand, partial=True, desc="negative: usage (default handling) for partial parsing and unknown command")
+
+        # Test list/dict args
+        test_cmd(cli, "instance info 1,2,3,4", ArgumentTypeError, desc="Negative bad list int arg")
+        test_cmd(cli, "instance info [1,2,3,4]", desc="list int arg")
+        test_cmd(cli, "instance info []", desc="list str arg")
+        test_cmd(cli, "instance info [6, 9]", desc="list str arg")
+        test_cmd(cli, "instance info [6, 9,    -1]", desc="list str arg")
+        test_cmd(cli, "instance info [6, 4, \"999 jjj\", \"kuku\"]", desc="list str arg")
+        test_cmd(cli, "instance info [6, 9] --ids [4, 5]", desc="list str arg and list int option")
+        test_cmd(cli, "instance info [6, 9] --complex [4, 5]", ArgumentTypeError, desc="negative: define nested array but use non nested array")
+        test_cmd(cli, "instance info [6, 9] --complex [[4, 5], [6,4,8], [4,5]]", desc="nested int arrays")
+        test_cmd(cli, "instance info [6, 9] --complexs [[4, 5], [6,4,8, bobob], [4,5]]", desc="nested str arrays")
+        test_cmd(cli, "instance info [6, 9] --complexst [ {key1 = bobo, key2 = 6 }, { key2 = 8} ]", desc="nested str arrays")
+        test_cmd(cli, "instance info [6, 9] --complexstar [ {key1 = bobo, key2 = 6 }, { key2 = 8, key3 = [ 5, 67, 0] } ]", desc="nested str arrays")
+        test_cmd(cli, "instance info [7] --cred { password = 'this is me', user = me, userid = 8}", desc="list str arg and struct option")
+        test_cmd(cli, "instance info [7] --cred { password = 'this ,is me', user = \" me=me\", userid = 8}", desc="list str arg and struct option with problematic chars")
+        test_cmd(cli, "instance info [7] --cred { password = 'this', user = me, userid = 8, stam=kuku}", ArgumentKeyError, desc="negative: unknown key")
+        test_cmd(cli, "instance set { password = 'this is me', user = me, userid = 8}", desc="struct arg")
+        test_cmd(cli, "instance set { password = 'this is me', user = me=me, userid = 8}", ArgumentTypeError, desc="negative: struct value with '='")
+        test_cmd(cli, "instance set { password = 'this is me', userid = }", ArgumentTypeError, desc="negative: struct key with no value")
+        test_cmd(cli, "instance check [ {key1 = bobo, key2 = 6 } 7, { key2 = 8} ]", ArgumentTypeError, desc="negative: text after nested struct")
+        test_cmd(cli, "instance check [ {key1 = bobo, key2 = 6 }, { key2 = 8, key3 = [ 5, 67, x] } ]", ArgumentTypeError, desc="negative: bad nested array value")
+
+        test_cmd(cli, "instance check [ {key1 = bobo, key2 = 6 }, { key2 = 8, key3 = [ 5, 67, 0] } ]", desc="nested str arrays arg")
+
+    # lazy groups are loaded on first use only, also after freezing
+    loaded = []
+    def load_lazy(group):
+        loaded.append(group.name)
+        cmd = group.add_command("run")
+        cmd.add_argument("count", type=int)
+    lazy_cli = MultiLevelArgParse("lazy cli", defaultfn=usage_and_raise_no_command, help=usage_and_raise_help)
+    lazy_cli.add_group("one", loader=load_lazy)
+    lazy_cli.add_group("two", loader=load_lazy)
+    lazy_cli.add_group("three", loader=load_lazy)
+    test_cmd(lazy_cli, "one run 6", desc="lazy group")
+    lazy_cli.freeze()
+    test_cmd(lazy_cli, "two run 5", desc="lazy group on a frozen tree")
+    if loaded != ["one", "two"]:
+        raise Exception("bad lazy groups loading %s" % loaded)
+
+    # snapshot save and load
+    import tempfile
+    snapshot = os.path.join(tempfile.mkdtemp(), "cli.snapshot")
+    lazy_cli.save_snapshot(snapshot, "key1")
+    if MultiLevelArgParse.load_snapshot(snapshot, "key2") is not None or os.path.exists(snapshot):
+        raise Exception("stale snapshot was loaded")
+    contexts = {"ctx1": object()}
+    cli.save_snapshot(snapshot, "key1", ctx_key=lambda ctx: "ctx1" if ctx is contexts["ctx1"] else None)
+    loaded_cli = MultiLevelArgParse.load_snapshot(snapshot, "key1", ctx_resolver=lambda key: contexts[key])
+    if not loaded_cli.frozen():
+        raise Exception("snapshot of a frozen tree is not frozen")
+    if str(loaded_cli.parse("instance info [7] --ids [1]")) != str(cli.parse("instance info [7] --ids [1]")):
+        raise Exception("bad snapshot parsing")
+    # the top level groups and their contexts are loaded on first use only
+    contexts = {"one": object(), "two": object()}
+    snap_cli = MultiLevelArgParse("snapshot cli", defaultfn=usage_and_raise_no_command, help=usage_and_raise_help)
+    for name in contexts:
+        snap_cli.add_group(name).add_command("run", ctx=contexts[name]).add_argument("count", type=int)
+    snap_cli.save_snapshot(snapshot, "key1", ctx_key=lambda ctx: "two" if ctx is contexts["two"] else "one")
+    resolved = []
+    loaded_cli = MultiLevelArgParse.load_snapshot(snapshot, "key1",
+                                                  ctx_resolver=lambda key: resolved.append(key) or contexts[key])
+    if resolved or loaded_cli.groups["one"].commands or loaded_cli.groups["two"].commands:
+        raise Exception("snapshot groups were loaded %s" % resolved)
+    if loaded_cli.parse("one run 3").command_ctx() is not contexts["one"] or resolved != ["one"] or \
+            loaded_cli.groups["two"].commands:
+        raise Exception("bad snapshot group loading %s" % resolved)
+    try:
+        snap_cli.save_snapshot(os.path.dirname(snapshot), "key1")
+        raise Exception("snapshot was saved to a dir")
+    except OSError:
+        if [f for f in os.listdir(os.path.dirname(snapshot)) if f.endswith(".tmp")]:
+            raise Exception("snapshot tmp file was left")
+    open(snapshot, "wb").write(b"corrupt")
+    if MultiLevelArgParse.load_snapshot(snapshot, "key1") is not None:
+        raise Exception("corrupt snapshot was loaded")
+    print("Snapshot save/load passed")
+
+    # a frozen tree can't be modified
+    try:
+        cli.add_command("late")
+        raise Exception("frozen cli tree was modified")
+    except ParseExecption as e:
+        print("Frozen tree modification failed as expected (%s)" % e.description)
+
+    # batch parsing: a bad line doesn't stop the batch
+    batch = ["instance info [7] --ids [1]", "", "# comment", "instance nosuchcommand", "instance",
+             ["instance", "info", "[7]"]]
+    results = list(cli.parse_many(batch))
+    if [lineno for lineno, r in results] != [1, 4, 5, 6]:
+        raise Exception("bad batch line numbers %s" % results)
+    if str(results[0][1]) != str(cli.parse(batch[0])) or not results[3][1].command():
+        raise Exception("bad batch parsing")
+    if not isinstance(results[1][1], UnknownToken) or not isinstance(results[2][1], NoCommand):
+        raise Exception("bad batch errors %s" % results)
+    print("Batch parsing passed")
+
+    # literals: the last char closes the literal, as in the tokenizer based parsing
+    literal_cli = MultiLevelArgParse("literal cli")
+    literal_cmd = literal_cli.add_command("set")
+    paths = literal_cmd.add_argument("paths", type=[str])
+    dirs = literal_cmd.add_argument("dirs", type=dict(a=str, b=[str]))
+    for arg, text, expect in ((paths, r"[C:\dir\]", ["C:\\dir\\"]),
+                              (paths, r"[a\,b, c]", ["a\\,b", "c"]),
+                              (paths, "[a]]", ["a]"]),
+                              (paths, "['x, y', , z ]", ["x, y", "z"]),
+                              (dirs, r"{a=C:\tmp\}", dict(a="C:\\tmp\\")),
+                              (dirs, "{a=q}r}", dict(a="q}r")),
+                              (dirs, r"{b=[x\, y, z], a=x}", dict(a="x", b=["x\\, y", "z"])),
+                              (dirs, "{a==b}", dict(a="b"))):
+        value = arg._value(text)
+        if (dict((k, value[k]) for k in value) if isinstance(value, Namespace) else value) != expect:
+            raise Exception("bad literal '%s' value %s" % (text, value))
+    for arg, text, expect in ((paths, "[a", ArgumentTypeError), (paths, "[[a]", ParseExecption),
+                              (paths, "['a]", ParseExecption), (dirs, "{a=b=c}", ArgumentTypeError),
+                              (dirs, "{c=1}", ArgumentKeyError)):
+        try:
+            arg._value(text)
+            raise Exception("bad literal '%s' was parsed" % text)
+        except ParseExecption as e:
+            if type(e) != expect:
+                raise
+    print("Literal parsing passed")
+
+    # argv: only args starting a literal are joined and tokenized, the rest are used as is
+    for argv, expect in ((["rename", "network [for] prod", "x{y", "z"], ["rename", "network [for] prod", "x{y", "z"]),
+                         (["children", "2", "[", "5,", "11", "]", "-a"], ["children", "2", "[ 5, 11 ]", "-a"]),
+                         (["set", " {a=b,", "c=[d]}", "e"], ["set", "{a=b, c=[d]}", "e"]),
+                         (["set", "[1,", "2", "-x"], ["set", "[1,", "2", "-x"]),
+                         (["set", "{a=[b}", "c"], ["set", "{a=[b}", "c"])):
+        tokens = MultiLevelCliBase.tokenize_argv(argv)
+        if tokens != expect:
+            raise Exception("bad argv tokens %s for %s" % (tokens, argv))
+    print("Argv tokenizing passed")
+
+    # argument values from files, in the literal syntax and in JSON
+    values = tempfile.mkdtemp()
+    def value_file(name, text):
+        path = os.path.join(values, name)
+        open(path, "w").write(text)
+        return path
+    literal = value_file("literal", "[ {key1 = bobo, key2 = 6 },\n { key2 = 8, key3 = [ 5, 67, 0] } ]\n")
+    as_json = value_file("json", '[{"key1": "bobo", "key2": 6}, {"key2": 8, "key3": [5, 67, 0]}]')
+    expect = str(cli.parse("instance check [ {key1 = bobo, key2 = 6 }, { key2 = 8, key3 = [ 5, 67, 0] } ]").args())
+    if str(cli.parse(["instance", "check", "@" + literal]).args()) != expect or \
+            str(cli.parse(["instance", "check", "@" + as_json]).args()) != expect:
+        raise Exception("bad argument value files")
+    ids = value_file("ids", "[1, 2]")
+    if cli.parse(["instance", "info", "[7]", "--ids", "@" + ids]).opt()["ids"] != [1, 2]:
+        raise Exception("bad option value file")
+    # JSON scalars are converted to str, but not a null
+    if [v["key1"] for v in cli.parse(["instance", "check", "@" + value_file(
+            "scalars", '[{"key1": 5}, {"key1": true}]')]).args()["complexstar"]] != ["5", "true"]:
+        raise Exception("bad JSON scalars to str conversion")
+    for text, expect in (('[{"key2": "x"}]', ArgumentTypeError), ('[{"key4": 1}]', ArgumentKeyError),
+                         ('{"key2": 1}', ArgumentTypeError), ('[{"key3": [1.9]}]', ArgumentTypeError),
+                         ('[{"key2": true}]', ArgumentTypeError), ('[{"key2": "1"}]', ArgumentTypeError),
+                         ('[{"key1": null}]', ArgumentTypeError), ('[{"key1": [1]}]', ArgumentTypeError)):
+        try:
+            cli.parse(["instance", "check", "@" + value_file("bad", text)])
+            raise Exception("bad value file '%s' was parsed" % text)
+        except ParseExecption as e:
+            if type(e) != expect:
+                raise
+    try:
+        cli.parse(["instance", "check", "@" + os.path.join(values, "missing")])
+        raise Exception("missing value file was parsed")
+    except ArgumentTypeError:
+        pass
+    # '@-' reads stdin, unless the command lines are read from it
+    saved_stdin, sys.stdin = sys.stdin, io.StringIO("[3, 4]")
+    try:
+        batch = ["instance info [7] --ids @-", "instance info [8]"]
+        results = list(cli.parse_many(batch, stdin=False))
+        if not isinstance(results[0][1], ArgumentTypeError) or results[1][1].args()["item"] != ["8"] or \
+                sys.stdin.read() != "[3, 4]":
+            raise Exception("bad '@-' value in command lines from stdin %s" % results)
+        sys.stdin.seek(0)
+        if next(cli.parse_many(batch))[1].opt()["ids"] != [3, 4]:
+            raise Exception("bad '@-' option value")
+    finally:
+        sys.stdin = saved_stdin
+    print("Argument value files passed")
+
+    # packed numeric lists
+    packed_cli = MultiLevelArgParse("packed cli", defaultfn=usage_and_raise_no_command, help=usage_and_raise_help)
+    packed_cmd = packed_cli.add_command("stats")
+    packed_cmd.add_argument("ids", type=[int], packed=True)
+    packed_cmd.add_option("m", "metrics", type=[float], packed=True)
+    n = packed_cli.parse(["stats", "[1, 2,3 ]", "-m", "[0.5, 1e3]"])
+    if n.args()["ids"] != array.array("q", [1, 2, 3]) or n.opt()["metrics"] != array.array("d", [0.5, 1000.0]):
+        raise Exception("bad packed lists %s" % n)
+    # quoted and empty elements are parsed by the literal parser
+    if packed_cli.parse(["stats", "[1, '2', , 3]"]).args()["ids"] != array.array("q", [1, 2, 3]) or \
+            packed_cli.parse(["stats", "[]"]).args()["ids"] != array.array("q"):
+        raise Exception("bad packed lists literal parsing")
+    if packed_cli.parse(["stats", "[1]", "-m", "@" + value_file("metrics", "[1, 2.5]")]).opt()["metrics"] != \
+            array.array("d", [1, 2.5]):
+        raise Exception("bad packed list value file")
+    for ids in ("[1.9]", "[true]", "[null]"):
+        try:
+            packed_cli.parse(["stats", "@" + value_file("ids", ids)])
+            raise Exception("bad packed list value file '%s' was parsed" % ids)
+        except ArgumentTypeError:
+            pass
+    for ids in ("[1, x]", "[%d]" % 2 ** 64):
+        try:
+            packed_cli.parse(["stats", ids])
+            raise Exception("bad packed list '%s' was parsed" % ids)
+        except ArgumentTypeError:
+            pass
+    try:
+        packed_cmd.add_argument("names", type=[str], packed=True)
+        raise Exception("a list of str was packed")
+    except ParseExecption:
+        pass
+    print("Packed lists passed")
+
+    # command line completion, in process and by the index file
+    completions = [("", ["alpha", "beta", "class", "help", "instance", "list"]),
+                   ("cl", ["class"]),
+                   ("class ", ["delete", "info", "list", "new"]),
+                   ("-t 5 class -", ["--help", "--trim", "-h", "-t"]),
+                   ("class new --m", ["--max_units", "--min_units"]),
+                   ("class new -x ", []),                               # option parameter
+                   ("class new name ", []),                             # argument
+                   ("class new name 10 -x 3 --", ["--help", "--max_units", "--min_units"]),
+                   ("nosuchgroup ", [])]
+    for line, expect in completions:
+        if cli.complete(line) != expect:
+            raise Exception("bad completion of '%s': %s" % (line, cli.complete(line)))
+    index_file = os.path.join(values, "cli.index")
+    lazy_cli.save_completion_index(index_file, base=cli, words=("shell",))
+    index = complete.load(index_file)
+    if complete.complete(index, [""]) != ["one", "shell", "three", "two"] or \
+            complete.complete(index, ["-q", "three", ""]) != ["run"] or complete.complete(index, ["--tr"]) != ["--treelevels"]:
+        raise Exception("bad completion index file")
+    script = MultiLevelArgParse.completion_script("democli", index_file, "bash")
+    if "complete -o default -F _democli democli" not in script or index_file not in script:
+        raise Exception("bad completion script:\n%s" % script)
+    print("Completion passed")
 
     if ns.write_checks:
         write_checks(ns.checks_file)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Command line completion of multilevelcli trees.
+A completion index (see MultiLevelArgParse.completion_index()) is a tuple of nodes, one per group/command where the
+root is node 0. Each node is (trie, args): a prefix trie of the node child (group/command) names and option spellings
+("-x", "--long"), and the number of the node (command) arguments. A trie is a dict of char -> sub trie, where the
+END key holds the value of the word that ends there: the child node id, or FLAG/VALUE for options with no parameter
+and with a parameter.
+The index is made of builtin types only and is saved by marshal, so it is loaded and walked by this module alone.
+Each node is saved on its own, and only the nodes along the completed command line are loaded (see IndexFile).
+The generated completion scripts import this module from its directory (see entry_point), which doesn't import the
+multilevelcli package (nor site, by python -S) and uses the cached module bytecode, to keep the per keystroke
+completion time minimal.
+"""
+import marshal
+import sys
+
+index_format = 1    # the completion index file format version
+_header_size = 8    # the header length field size
+# python -c code that runs main(): the arguments are the module directory, the index file and the words
+entry_point = "import sys; sys.path[0] = sys.argv.pop(1); import complete; sys.exit(complete.main(sys.argv[1:]))"
+END = ""
+FLAG = -1
+VALUE = -2
+
+
+def trie_add(trie, word, value):
+    for c in word:
+        trie = trie.setdefault(c, {})
+    trie[END] = value
+
+
+def trie_get(trie, word, default=None):
+    """
+    :return: the value of the given (complete) word.
+    """
+    for c in word:
+        trie = trie.get(c)
+        if trie is None:
+            return default
+    return trie.get(END, default)
+
+
+def trie_words(trie, prefix):
+    """
+    Generate the words that start with the given prefix, sorted.
+    """
+    for c in prefix:
+        trie = trie.get(c)
+        if trie is None:
+            return
+    pending = [(prefix, trie)]
+    while pending:
+        word, trie = pending.pop()
+        if END in trie:
+            yield word
+        # pushed in reverse order, so the words are generated sorted
+        pending.extend((word + c, trie[c]) for c in sorted(trie, reverse=True) if c != END)
+
+
+def complete(index, words):
+    """
+    Complete the last word of a command line.
+    :param index: the completion index.
+    :param words: the command line words (without the program name), where the last one is the (partial) word to
+            complete.
+    :return: list of the possible completions. It is empty for arguments and option parameters, or after an unknown
+            token.
+    """
+    node = 0
+    argnum = 0
+    param = False
+    words = list(words) or [""]
+    for word in words[:-1]:
+        if param:
+            param = False
+            continue
+        trie, args = index[node]
+        value = trie_get(trie, word)
+        if value == VALUE:
+            param = True
+        elif value == FLAG:
+            continue
+        elif value is not None:
+            node = value
+            argnum = 0
+        elif word.startswith("-"):
+            return []
+        elif argnum < args:
+            argnum += 1
+        else:
+            return []
+    trie, args = index[node]
+    prefix = words[-1]
+    if param or (argnum < args and not prefix.startswith("-")):
+        return []
+    if not prefix:
+        # the options are completed only when a '-' is typed
+        return [w for c in sorted(trie) if c != END and c != "-" for w in trie_words(trie, c)]
+    return list(trie_words(trie, prefix))
+
+
+class IndexFile(object):
+    """
+    A completion index file: the header length, the marshal header (format, node offsets) and the marshal nodes.
+    The node offsets are relative to the header end. The nodes are loaded on access.
+    """
+    __slots__ = ("data", "offsets", "nodes")
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+        self.nodes = {}
+
+    def __getitem__(self, node_id):
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = marshal.loads(self.data[self.offsets[node_id]:self.offsets[node_id + 1]])
+        return node
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+def load(path):
+    """
+    :return: the completion index (IndexFile) of the given file, or None if there is no valid index file.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = memoryview(f.read())
+        size = int.from_bytes(data[:_header_size], "little")
+        fmt, offsets = marshal.loads(data[_header_size:_header_size + size])
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return IndexFile(data[_header_size + size:], offsets) if fmt == index_format else None
+
+
+def save(path, index):
+    """
+    Save the completion index to the given file (replaced atomically).
+    """
+    import os
+    nodes = [marshal.dumps(node) for node in index]
+    offsets = [0]
+    for node in nodes:
+        offsets.append(offsets[-1] + len(node))
+    header = marshal.dumps((index_format, tuple(offsets)))
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(len(header).to_bytes(_header_size, "little"))
+        f.write(header)
+        for node in nodes:
+            f.write(node)
+    os.replace(tmp, path)
+
+
+def main(argv):
+    """
+    Print the completions of the command line, one per line.
+    :param argv: the index file path followed by the command line words (see complete()).
+    """
+    if not argv:
+        print("usage: %s <index file> [word ...]" % sys.argv[0], file=sys.stderr)
+        return 2
+    index = load(argv[0])
+    if index is None:
+        return 1
+    for word in complete(index, argv[1:]):
+        print(word)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,33 +1,75 @@
 #!/usr/bin/env python3
 from pyswagger import App, Security, spec
-from pyswagger.contrib.client.requests import Client
-from urllib.parse import urlparse, urlunparse, urlsplit, urlunsplit
-
+from pyswagger.core import BaseClient
+from requests import Request
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import parse_qsl, urlparse, urlunparse, urlsplit, urlunsplit
+
+import asyncio
+import codecs
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import hashlib
+import io
 import json
+import os
+import pickle
+import socket
+import socketserver
 import sys
 import traceback
 import logging
 import multilevelcli
 import re
+import requests
+import swagger_cli_client
+import weakref
 
 log = None
+DEFAULT_CACHE_DIR = "~/.cache/swagger_cli"     # the cache dir of files that are needed also without --cache_dir
 classes = {}
 instances = {}
 namespaces = {}
 
-def debug(msg, json_data = None):
-    log.debug("%s: %s" % (msg, json.dumps(json_data, sort_keys=True, indent=4, default=str)))
+class LazyJson(object):
+    """
+    Log argument that defers the json dump of the data until the log record is actually formatted.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return json.dumps(self.data, sort_keys=True, indent=4, default=str)
+
+
+def debug(msg, *args, json_data = None):
+    """
+    Log a debug message. Nothing is formatted (msg % args, json dump) unless debug logging is enabled.
+    """
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+    if json_data is not None:
+        log.debug(msg + ": %s", *(args + (LazyJson(json_data),)))
+    else:
+        log.debug(msg, *args)
 
 
-def info(msg, json_data = None):
+def info(msg, *args, json_data = None):
+    if not log.isEnabledFor(logging.INFO):
+        return
     if json_data:
-        log.info("%s: %s" % (msg, json.dumps(json_data, sort_keys=True, indent=4, default=str)))
+        log.info(msg + ": %s", *(args + (LazyJson(json_data),)))
     else:
-        log.info(msg)
+        log.info(msg, *args)
 
 
 def panic(msg, code = 1, trace=False):
-    log.error("PANIC: %s" % msg)
+    log.error("PANIC: %s", msg)
     if trace:
         traceback.print_exc()
     sys.exit(code)
@@ -45,10 +87,400 @@ class ResultError(Exception):
             err = json.loads(self.raw)
             return "%s: Failed with status %s: %s" % (self.op, self.status, err["error"]["message"])
         except Exception as e:
-            log.error("Error (non json) %s" % str(e))
+            log.error("Error (non json) %s", e)
         return "op %s: failed on status %d: '%s'" % (self.op, self.status, self.raw)
 
 
+class AppPickler(pickle.Pickler):
+    """
+    Pickler of a prepared pyswagger App. The app refers to the RESTClient by its url load hook, which is saved as a
+    persistent reference, and to its own objects by weak proxies, which are saved as proxies of their referents.
+    """
+    cache_version = 1   # bump when the cached app layout changes, to invalidate the app caches
+
+    def __init__(self, f, client):
+        pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+        self.client = client
+
+    def persistent_id(self, obj):
+        return "client" if obj is self.client else None
+
+    def reducer_override(self, obj):
+        if isinstance(obj, weakref.ProxyTypes):
+            # attribute access is forwarded to the referent, so this is the referent's bound method
+            return weakref.proxy, (obj.__repr__.__self__,)
+        return NotImplemented
+
+
+class OpPlan(object):
+    """
+    The request routing plan of an operation, used as the command ctx: the location (path, query or body) of each
+    command argument/option, the body parameter name, the body skeleton (the schema defaults of the body struct
+    properties, see request()) and the reply shape. The plan is compiled once, on first use (or by
+    CliParser.process_command()), rather than per request.
+    The reply shape is taken from the success reply schema: "array", "page" - an object with a single array member
+    (member is its name) where the operation has paging query parameters (see Paginator), "object" for any other
+    schema, or None if the operation has no reply schema.
+    """
+    __slots__ = ("op", "app", "routes", "body", "skeleton", "reply", "member")
+
+    def __init__(self, op, app):
+        assert isinstance(op, spec.v2_0.objects.Operation)
+        self.op = op
+        self.app = app
+        self.routes = None
+        self.body = None
+        self.skeleton = {}
+        self.reply = None
+        self.member = None
+
+    def compile(self):
+        if self.routes is not None:
+            return self
+        routes = {}
+        for p in self.op.parameters:
+            is_in = str(p.__getattribute__("in"))
+            if p.schema and p.schema.ref_obj:
+                # the properties of a struct param are in its location (the entire struct is in)
+                o = self.app.resolve('#/definitions/%s' % p.schema.ref_obj.name)
+                for pr, prop in o.properties.items():
+                    if routes.setdefault(pr, is_in) == "body" and is_in == "body" and prop.default is not None:
+                        self.skeleton.setdefault(pr, prop.default)
+            routes.setdefault(p.name, is_in)
+            if is_in == "body" and self.body is None:
+                self.body = p.name
+        for code, r in self.op.responses.items():
+            if not str(code).startswith("2") or not r.schema:
+                continue
+            schema = r.schema.ref_obj or r.schema
+            arrays = [name for name, pr in (schema.properties or {}).items() if (pr.ref_obj or pr).type == "array"]
+            paging = any(routes.get(name) == "query" for name in Paginator.paging_params)
+            if schema.type == "array":
+                self.reply = "array"
+            elif len(arrays) == 1 and paging:
+                self.reply = "page"
+                self.member = arrays[0]
+            else:
+                self.reply = "object"
+            break
+        self.routes = routes
+        return self
+
+    def route(self, name):
+        """
+        :return: the location of the named argument/option, or None if it is not an operation parameter.
+        """
+        return self.compile().routes.get(name)
+
+    def __reduce__(self):
+        # the plan is recompiled on load (e.g. of a tree snapshot saved without ctx keys)
+        return OpPlan, (self.op, self.app)
+
+
+class PooledClient(BaseClient):
+    """
+    pyswagger requests client with a configured connection pool, shared by all the operations the client executes.
+    The pyswagger requests client (pyswagger.contrib.client.requests.Client) keeps its session private, so this client
+    is built on the documented BaseClient interface instead, and sends the requests as that client does.
+    """
+    __schemes__ = set(["http", "https"])
+
+    def __init__(self, auth, pool_hosts=10, pool_size=10, retries=0, timeout=None, keep_alive=True):
+        """
+        :param pool_hosts: the number of hosts to keep connection pools for.
+        :param pool_size: the max connections per host. Requests wait for a free connection rather than exceed it.
+        :param retries: retries of failed connections and 502/503/504 replies of idempotent requests.
+        :param timeout: the connect/read timeout in seconds. None waits forever.
+        :param keep_alive: if False, the connections are closed after each request.
+        """
+        BaseClient.__init__(self, auth)
+        self.send_opt = dict(timeout=timeout) if timeout else {}
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size, pool_block=True,
+                              max_retries=Retry(total=retries, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                                                raise_on_status=False))
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def prepare(self, req_and_resp, opt=None, headers=None):
+        """
+        Prepare the request: patch it (auth, ...) by BaseClient.request() and build the requests request of it.
+        :return: the pyswagger response and the requests PreparedRequest.
+        """
+        req, resp = req_and_resp
+        req.reset()
+        resp.reset()
+
+        opt = opt or {}
+        req, resp = BaseClient.request(self, (req, resp), opt)
+        req.prepare(scheme=self.prepare_schemes(req), handle_files=False)
+        req._patch(opt)
+
+        files = []
+        for name, objs in req.files.items():
+            for obj in objs if isinstance(objs, list) else [objs]:
+                f = obj.data or open(obj.filename, "rb")
+                files.append((name, (obj.filename, f, obj.header["Content-Type"]) if "Content-Type" in obj.header
+                              else (obj.filename, f)))
+        rq = Request(method=req.method.upper(), url=req.url, params=req.query, data=req.data,
+                     headers=self.compose_headers(req, headers, opt, as_dict=True), files=files)
+        return resp, self.session.prepare_request(rq)
+
+    def request(self, req_and_resp, opt=None, headers=None):
+        """
+        Send the request and apply the reply to the pyswagger response.
+        :return: the pyswagger response.
+        """
+        resp, rq = self.prepare(req_and_resp, opt, headers)
+        rs = self.session.send(rq, **self.send_opt)
+        resp.apply_with(status=rs.status_code, header=rs.headers, raw=rs.content)
+        return resp
+
+    def send(self, req_and_resp, opt=None, headers=None):
+        """
+        Send the request as request() does, but return the requests response with the body not read yet, so it can
+        be streamed. The pyswagger response is not updated.
+        """
+        return self.session.send(self.prepare(req_and_resp, opt, headers)[1], stream=True, **self.send_opt)
+
+
+class JsonItems(object):
+    """
+    Incremental parser of a JSON reply. Iterating yields the items of the top level array as they arrive, or of the
+    list member of a page object (if the member name is given). Any other reply is yielded as is. Only the current
+    item is buffered.
+    """
+    _ws = re.compile(r"\s*")
+
+    def __init__(self, chunks, member=None):
+        """
+        :param chunks: iterable of the reply text chunks.
+        :param member: the list member name of a page object reply (see OpPlan). Its other members are skipped.
+        """
+        self.member = member
+        self.chunks = iter(chunks)
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def more(self):
+        """
+        Read the next chunk, dropping the parsed text.
+        :return: False at the end of the reply.
+        """
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        """
+        Skip the whitespace and return the next char, or "" at the end of the reply.
+        """
+        while True:
+            self.pos = self._ws.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return ""
+
+    def next_char(self, expected):
+        c = self.peek()
+        if c not in expected:
+            raise ValueError("Bad JSON reply: expected one of '%s', got '%s'" % (expected, c))
+        self.pos += 1
+        return c
+
+    def value(self):
+        """
+        Decode the next value. A value is complete only if it is followed by text that can't continue it, e.g. the
+        "12" of "12.5" is not.
+        """
+        self.peek()
+        while True:
+            try:
+                v, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            if end < len(self.buf) and (not isinstance(v, (int, float)) or self.buf[end] not in "0123456789.eE+-") \
+                    or not self.more():
+                self.pos = end
+                return v
+
+    def array(self):
+        self.next_char("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.next_char(",]") == "]":
+                return
+
+    def __iter__(self):
+        c = self.peek()
+        if c == "[":
+            yield from self.array()
+        elif c == "{" and self.member is not None:
+            self.pos += 1
+            members = {}
+            paged = False
+            if self.peek() == "}":
+                self.pos += 1
+            else:
+                while True:
+                    key = self.value()
+                    self.next_char(":")
+                    if key == self.member and self.peek() == "[":
+                        yield from self.array()
+                        paged = True
+                    else:
+                        members[key] = self.value()
+                    if self.next_char(",}") == "}":
+                        break
+            if not paged:
+                # not a page
+                yield members
+        elif c:
+            yield self.value()
+
+
+class Paginator(object):
+    """
+    Lazy iterator of the items of all the pages of a list operation. The next page is fetched in the background while
+    the items of the current one are consumed. The paging convention is detected from the operation query parameters
+    and the replies: Link rel="next" headers, page tokens (cursor, page_token, marker, ...), offset/limit and
+    page/per_page. The reply of other operations (see lists()) is yielded as is.
+    """
+    offset_params = ("offset", "skip", "start")
+    page_params = ("page", "page_number", "pageNumber")
+    limit_params = ("limit", "page_size", "pageSize", "per_page", "perPage", "max_results", "maxResults")
+    token_params = ("page_token", "pageToken", "cursor", "marker", "next_token", "nextToken", "continuation_token",
+                    "continuationToken", "starting_after", "after")
+    token_keys = ("next_page_token", "nextPageToken", "next_cursor", "nextCursor", "next_marker", "nextMarker",
+                  "next_token", "nextToken", "continuation_token", "continuationToken", "cursor", "next")
+    paging_params = offset_params + page_params + limit_params + token_params
+    _link_next = re.compile(r'<([^>]*)>\s*;[^,]*rel="?next"?')
+
+    def __init__(self, rest, plan, cmd, args, opts, max_items=0):
+        """
+        :param plan: the operation OpPlan.
+        :param max_items: stop after max_items items. 0 means all the items.
+        """
+        self.rest = rest
+        self.plan = plan
+        self.cmd = cmd
+        self.args = args
+        self.opts = opts
+        self.max_items = max_items
+        self.query = set(name for name, is_in in plan.compile().routes.items() if is_in == "query")
+        self.offset = self.param(self.offset_params)
+        self.page = self.param(self.page_params)
+        self.limit = self.param(self.limit_params)
+        self.token = self.param(self.token_params)
+
+    def param(self, names):
+        for name in names:
+            if name in self.query:
+                return name
+        return None
+
+    def lists(self):
+        """
+        Whether the operation is a list operation: a get whose reply is an array or a page object (see OpPlan). Without
+        a reply schema, whether the operation has paging query parameters.
+        """
+        if str(self.plan.op.method).lower() != "get":
+            return False
+        paging = any((self.offset, self.page, self.limit, self.token))
+        return self.plan.reply in ("array", "page") or self.plan.reply is None and paging
+
+    def items(self, out):
+        """
+        Return the items of a page: the reply list, or the list member of a page object - the member of the reply
+        schema (see OpPlan), or the single list member of the reply object. None if the reply is not a page.
+        """
+        if isinstance(out, list):
+            return out
+        if isinstance(out, dict):
+            lists = [out.get(self.plan.member)] if self.plan.member else [v for v in out.values() if isinstance(v, list)]
+            if len(lists) == 1 and isinstance(lists[0], list):
+                return lists[0]
+        return None
+
+    def next_opts(self, out, resp, opts, items):
+        """
+        Return the options of the next page request, or None if this is the last page.
+        """
+        if not items:
+            return None
+        for k, v in resp.header.items():
+            m = self._link_next.search(",".join(v)) if k.lower() == "link" else None
+            if m:
+                return self.query_opts(opts, m.group(1))
+        if self.token and isinstance(out, dict):
+            for key in self.token_keys:
+                token = out.get(key)
+                if not token or token == opts.get(self.token):
+                    continue
+                if isinstance(token, str) and "://" in token:
+                    return self.query_opts(opts, token)     # a next page url
+                return dict(opts, **{self.token: token})
+        # the paging options may be strings taken from a next page url
+        limit = int(opts.get(self.limit) or 0)
+        if limit and len(items) < limit:
+            return None
+        if self.offset:
+            return dict(opts, **{self.offset: int(opts.get(self.offset) or 0) + len(items)})
+        if self.page:
+            return dict(opts, **{self.page: int(opts.get(self.page) or 1) + 1})
+        return None
+
+    def query_opts(self, opts, url):
+        """
+        Return the options of the next page url: its query args that are the operation query parameters.
+        """
+        query = dict((k, v) for k, v in parse_qsl(urlsplit(url).query) if k in self.query)
+        return dict(opts, **query) if query else None
+
+    def __iter__(self):
+        executor = concurrent.futures.ThreadPoolExecutor(1)
+        try:
+            count = 0
+            opts = dict((k, self.opts[k]) for k in self.opts)
+            future = executor.submit(self.rest.send_req, self.plan, self.cmd, self.args, opts)
+            first = None
+            lists = self.lists()
+            while future:
+                out, resp = future.result()
+                items = self.items(out) if lists else None
+                if items is None:
+                    # not a list operation or reply
+                    yield out
+                    return
+                if items and items[0] == first:
+                    log.error("%s: paging stopped on a repeated page %s", self.cmd.full_name("."), opts)
+                    return
+                first = items[0] if items else None
+                opts = self.next_opts(out, resp, opts, items)
+                count += len(items)
+                # prefetch the next page while this page is consumed
+                future = executor.submit(self.rest.send_req, self.plan, self.cmd, self.args, opts) \
+                    if opts and (not self.max_items or count < self.max_items) else None
+                debug("%s: page of %d items, next page %s", self.cmd.full_name("."), len(items), opts)
+                if self.max_items and count > self.max_items:
+                    items = items[:len(items) - (count - self.max_items)]
+                yield from items
+        finally:
+            executor.shutdown(wait=False)
+
+
 class RESTClient(object):
     def resolve(self, p):
         if not self.url:
@@ -60,11 +492,11 @@ class RESTClient(object):
             self.initial_load = False
         else:
             new = urlunsplit((self.url.scheme, self.url.netloc, o.path, o.query, o.fragment))
-        debug("------%s  : %s -> %s" % (str(o), self.url, new))
+        debug("------%s  : %s -> %s", o, self.url, new)
         return new
 
-    def __init__(self, schema, security=None, url=None):
-        log.info("### RESTClient using %s, server url='%s' security %s" % (schema, url, str(security)))
+    def __init__(self, schema, security=None, url=None, cache_dir=None, pool=None):
+        log.info("### RESTClient using %s, server url='%s' security %s", schema, url, security)
         # create a App with a local resource file
 
         if not schema:
@@ -72,16 +504,25 @@ class RESTClient(object):
         # load Swagger resource file into App object
         self.initial_load = False
         self.schema = schema
-        if url:
-            self.url = urlparse(url)
-            if schema:
-                self.initial_load = True
-            self.app = App.load(url, url_load_hook=self.resolve if url else None)
+        self.url = urlparse(url) if url else None
+        self.objects = {}   # get_object() skeletons by object name
+
+        cache, key = self.app_cache(cache_dir, url)
+        self.app = self.load_app(cache, key) if cache else None
+        if self.app:
+            log.info("Loaded schema app cache '%s'", cache)
         else:
-            # Server url is not specified. In this case the server is taken from the schema.
-            self.app = App.load(schema, url_load_hook=self.resolve if url else None)
+            if url:
+                self.initial_load = True
+                self.app = App.load(url, url_load_hook=self.resolve)
+            else:
+                # Server url is not specified. In this case the server is taken from the schema.
+                self.app = App.load(schema)
+
+            self.app.prepare(True)
+            if cache:
+                self.save_app(cache, key)
 
-        self.app.prepare(True)
         #self.serverapp = App(url_load_hook=self.resolve)
         #self.serverapp.prepare() = App(url_load_hook=self.resolve)
 
@@ -96,61 +537,129 @@ class RESTClient(object):
             #auth.update_with('api_key', '')  # api key
             #auth.update_with('simple_oauth2', '12334546556521123fsfss')  # oauth2
 
-        # init the client
-        self.client = Client(auth)
-
-    def do_req(self, op, cmd, args, opts, expected=None):
-        def arg_in(op, name):
-            for p in op.parameters:
-                if p.schema:
-                    object_name = p.schema.ref_obj.name
-                    o = self.app.resolve('#/definitions/%s' % object_name)
-                    for pr in o.properties:
-                        if pr == name:
-                            return p.__getattribute__("in")   # the entire struct is in
-                if p.name == name:
-                    return p.__getattribute__("in")
-            return False
+        # init the client. The connection pool is shared by all the requests
+        self.client = PooledClient(auth, **(pool or {}))
 
-        if expected is None:
-            expected = [200, 201, 204]
-        debug("post_req: %s %s %s" % (op, args, opts))
-        resp = None
-        out = None
-        params = {}
-        payload = {}
+    def validator(self):
+        """
+        Return the validator of the schema: (mtime, size) of a local schema file or the (ETag, Last-Modified) headers
+        of a remote one, or None if the schema can't be validated.
+        """
+        if os.path.isfile(self.schema):
+            st = os.stat(self.schema)
+            return st.st_mtime_ns, st.st_size
+        if urlsplit(self.schema).scheme not in ("http", "https"):
+            return None
+        try:
+            r = requests.head(self.schema, allow_redirects=True, timeout=10)
+        except requests.RequestException as e:
+            log.error("Failed to validate schema '%s': %s", self.schema, e)
+            return None
+        etag = r.headers.get("ETag")
+        modified = r.headers.get("Last-Modified")
+        if r.status_code != 200 or not (etag or modified):
+            return None
+        return etag, modified
+
+    def app_cache(self, cache_dir, url):
+        """
+        Return the app cache file path and key for the schema and the server url, or (None, None) if there is no
+        cache dir or the schema can't be validated.
+        """
+        if not cache_dir:
+            return None, None
+        validator = self.validator()
+        if validator is None:
+            return None, None
+        source = os.path.abspath(self.schema) if os.path.isfile(self.schema) else self.schema
+        name = hashlib.sha256(("%s|%s" % (source, url or "")).encode()).hexdigest()[:16]
+        path = os.path.join(os.path.expanduser(cache_dir), "app-%s.cache" % name)
+        return path, (AppPickler.cache_version, source, url, validator)
 
-        for p in args:
-            if args[p] == None:
-                continue
-            is_in = arg_in(op, p)
-            if is_in in ["path","query"]:
-                params[p] = args[p]
-            elif is_in == "body":
-                payload[p] = args[p]
-            else:
-                pass # ignore
+    def load_app(self, path, key):
+        """
+        Load the prepared app from the cache file.
+        :return: the app, or None if there is no cache or the cache is stale.
+        """
+        try:
+            with open(path, "rb") as f:
+                unpickler = pickle.Unpickler(f)
+                unpickler.persistent_load = lambda pid: self if pid == "client" else None
+                if unpickler.load() != key:
+                    return None
+                return unpickler.load()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.error("Dropping corrupt schema app cache '%s': %s", path, e)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def save_app(self, path, key):
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                pickler = AppPickler(f, self)
+                pickler.dump(key)
+                pickler.dump(self.app)
+            os.replace(tmp, path)
+            log.info("Saved schema app cache '%s'", path)
+        except Exception as e:
+            log.error("Failed to save schema app cache '%s': %s", path, e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
 
-        for p in opts:
-            if opts[p] == None:
-                continue
-            is_in = arg_in(op, p)
-            if is_in in ["path","query"]:
-                params[p] = opts[p]
-            elif is_in == "body":
-                payload[p] = opts[p]
-            else:
-                pass # ignore
+    def request(self, plan, args, opts):
+        """
+        Build the operation request from the command args and options, by the operation plan. The body payload is the
+        plan body skeleton, filled with the body args and options.
+        :return: the pyswagger (request, response).
+        """
+        params = {}
+        payload = dict(plan.compile().skeleton)
+
+        for values in (args, opts):
+            for p in values:
+                v = values[p]
+                if v is None:
+                    continue
+                is_in = plan.route(p)
+                if is_in in ("path", "query"):
+                    params[p] = v
+                elif is_in == "body":
+                    payload[p] = v
+                # else ignore
 
         if payload:
-            params["payload"] = payload
-            #print ("payload=='%s'" % payload)
+            params[plan.body or "payload"] = payload
+        req, resp = plan.op(**params)
+
+        # prefer json as response
+        req.produce('application/json')
+        return req, resp
+
+    def do_req(self, plan, cmd, args, opts, expected=None):
+        return self.send_req(plan, cmd, args, opts, expected)[0]
+
+    def send_req(self, plan, cmd, args, opts, expected=None):
+        """
+        Run the operation.
+        :return: (reply data, pyswagger response)
+        """
+        if expected is None:
+            expected = [200, 201, 204]
+        debug("post_req: %s %s %s", plan.op, args, opts)
+        resp = None
+        out = None
         try:
             # try to making a request
-            req, resp = op(**params)
-
-            # prefer json as response
-            req.produce('application/json')
+            req, resp = self.request(plan, args, opts)
             #print ("----> %s", req)
             reply = self.client.request((req, resp))
             out = reply.data
@@ -162,8 +671,23 @@ class RESTClient(object):
         if out is None:
             if 'application/json' in reply.header['Content-Type']:
                 out = json.loads(reply.raw)
-        debug(op, out)
-        return out
+        debug("%s", plan.op, json_data=out)
+        return out, resp
+
+    def stream_req(self, plan, cmd, args, opts, expected=None, chunk_size=65536):
+        """
+        Run the operation and yield the items of the JSON reply as they arrive (see JsonItems), rather than read and
+        decode the whole reply.
+        """
+        if expected is None:
+            expected = [200, 201, 204]
+        debug("stream_req: %s %s %s", plan.op, args, opts)
+        rs = self.client.send(self.request(plan, args, opts))
+        with rs:
+            if rs.status_code not in expected:
+                raise ResultError(cmd.full_name("."), rs.status_code, rs.text)
+            chunks = codecs.iterdecode(rs.iter_content(chunk_size), rs.encoding or "utf-8")
+            yield from JsonItems(chunks, plan.compile().member)
 
     def get_object(self, object_name):
         '''
@@ -171,20 +695,23 @@ class RESTClient(object):
         :param object_name: an object from a OpenAPI model (under #/definitions).
         :return:  a dictionary with all properties, set to the default or None.
         '''
-        o = self.app.resolve('#/definitions/%s' % object_name).dump()
-        assert o["type"] == "object"
+        obj = self.objects.get(object_name)
+        if obj is None:
+            o = self.app.resolve('#/definitions/%s' % object_name).dump()
+            assert o["type"] == "object"
 
-        obj = {}
+            obj = {}
 
-        for p in o["properties"]:
-            d = o["properties"][p]
-            if d.get("default", None):
-                obj[p] = d["default"]
-            elif p in o.get("required", []):
-                obj[p] = None   # to be filled later!
+            for p in o["properties"]:
+                d = o["properties"][p]
+                if d.get("default", None):
+                    obj[p] = d["default"]
+                elif p in o.get("required", []):
+                    obj[p] = None   # to be filled later!
+            self.objects[object_name] = obj
 
-        debug("get_object: '%s':" % (object_name), obj)
-        return obj
+        debug("get_object: '%s':", object_name, json_data=obj)
+        return copy.deepcopy(obj)
 
     def models(self):
         for o in self.app.m:
@@ -199,19 +726,203 @@ class RESTClient(object):
         ##op = self.app.resolve('#/definitions/%s' % o).dump()
         #print op
 
-def exec_command(rest, cli_result):
-    debug("CLI result: %s" % str(cli_result))
+def run_command(rest, cli_result):
+    """
+    Execute the operation of the parsed command.
+    :return: the reply data.
+    """
+    debug("CLI result: %s", cli_result)
     assert isinstance(rest, RESTClient)
     assert isinstance(cli_result, multilevelcli.CliResult)
-    op = cli_result.command_ctx()
-    assert isinstance(op, spec.v2_0.objects.Operation)
-    debug("CLI exec: cmd %s args %s opt %s" % (cli_result.command(), cli_result.args(), cli_result.opt()))
-    out = rest.do_req(op, cli_result.command(), cli_result.args(), cli_result.opt())
+    plan = cli_result.command_ctx()
+    assert isinstance(plan, OpPlan)
+    debug("CLI exec: cmd %s args %s opt %s", cli_result.command(), cli_result.args(), cli_result.opt())
+    return rest.do_req(plan, cli_result.command(), cli_result.args(), cli_result.opt())
+
+
+def exec_command(rest, cli_result, stream=False, max_items=None):
+    """
+    Execute the parsed command and write the reply.
+    :param stream: write the reply items as json lines as they arrive (see RESTClient.stream_req()).
+    :param max_items: for list operations (see Paginator.lists()), fetch the pages of the reply up to max_items
+            items. 0 means all the items, None only the first page. Other operations ignore it.
+    """
+    plan = cli_result.command_ctx()
+    items = Paginator(rest, plan, cli_result.command(), cli_result.args(), cli_result.opt(), max_items) \
+        if max_items is not None else None
+    if items is not None and items.lists():
+        if stream:
+            for item in items:
+                print(json.dumps(item, sort_keys=True, default=str))
+            return
+        # a json array, written as the items are fetched
+        sep = "[\n"
+        for item in items:
+            sys.stdout.write(sep + json.dumps(item, sort_keys=True, indent=4, default=str))
+            sep = ",\n"
+        print("[]" if sep == "[\n" else "\n]")
+        return
+    if stream:
+        # one item per line (NDJSON), written as the reply arrives
+        for item in rest.stream_req(plan, cli_result.command(), cli_result.args(), cli_result.opt()):
+            print(json.dumps(item, sort_keys=True, default=str))
+        return
+    out = run_command(rest, cli_result)
 
     #print (json.loads(str(out)).dump(indent=4))
     print (json.dumps(out, sort_keys=True, indent=4, default=str))
 
 
+def read_lines(prompt=None):
+    """
+    Yield the shell command lines until EOF or an exit/quit line.
+    :param prompt: prompt the user with the given prompt. If None the lines are read from stdin as is (piped script).
+    """
+    lines = iter(sys.stdin) if prompt is None else None
+    while True:
+        try:
+            line = input(prompt) if lines is None else next(lines)
+        except (EOFError, StopIteration):
+            return
+        except KeyboardInterrupt:
+            print()
+            continue
+        if line.strip() in ("exit", "quit"):
+            return
+        yield line
+
+
+def run_shell(rest, parser, stream=False, max_items=None):
+    """
+    Run the command lines from a prompt (or a piped script) using the already loaded schema, tree and client. The
+    lines are read from stdin, so '@-' values are rejected.
+    :param stream: the session --stream option (see exec_command()).
+    :param max_items: the session --all/--max_items options (see exec_command()).
+    :return: the exit code - 1 if any command failed.
+    """
+    interactive = sys.stdin.isatty()
+    parser.cli.freeze()
+    if interactive:
+        try:
+            import readline     # line editing, history and commands completion for input()
+            readline.set_completer_delims(" \t")
+            readline.set_completer(lambda text, state: (parser.cli.complete(
+                readline.get_line_buffer()[:readline.get_endidx()]) + [None])[state])
+            readline.parse_and_bind("tab: complete")
+        except ImportError:
+            pass
+
+    failed = 0
+    lines = read_lines("%s> " % os.path.basename(sys.argv[0]) if interactive else None)
+    # help and incomplete commands print the usage and fail the line rather than exit the shell
+    with raising_help(parser, multilevelcli.usage_and_raise_help):
+        for lineno, cli_out in parser.cli.parse_many(lines, nocommand=multilevelcli.usage_and_raise_no_command,
+                                                     stdin=False):
+            if isinstance(cli_out, multilevelcli.ParseExecption):
+                if not isinstance(cli_out, multilevelcli.HelpRquired):
+                    print(str(cli_out) if interactive else "line %d: %s" % (lineno, cli_out))
+                    failed += 1
+                continue
+            try:
+                exec_command(rest, cli_out, stream=stream, max_items=max_items)
+            except ResultError as e:
+                print(str(e))
+                failed += 1
+            except Exception as e:
+                log.error("%s failed: %s", cli_out.command().full_name("."), e, exc_info=True)
+                print("%s: %s" % (cli_out.command().full_name("."), e))
+                failed += 1
+    return 1 if failed else 0
+
+
+def write_completion(cli, parser, schema, cache_dir, shell):
+    """
+    Save the completion index of the schema commands tree and print the shell completion script that uses it. The
+    script completes the command lines by the index alone, without loading the schema. It should be generated again
+    when the schema commands change.
+    :param cli: the main options parser (see init_cmdline_parser()).
+    :param shell: "bash" or "zsh".
+    :return: the exit code.
+    """
+    name = hashlib.sha256(schema.encode()).hexdigest()[:16]
+    path = os.path.join(os.path.expanduser(cache_dir or DEFAULT_CACHE_DIR), "complete-%s.index" % name)
+    script = multilevelcli.MultiLevelArgParse.completion_script(["swagger_cli.py", "swagger_cli_client.py"], path, shell)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    parser.cli.save_completion_index(path, base=cli, words=("shell", "batch", "serve", "completion"))
+    log.info("Saved completion index '%s'", path)
+    print(script, end="")
+    return 0
+
+
+def raise_help(ent):
+    raise multilevelcli.HelpRquired("Help is not available for '%s' in batch mode" % ent.full_name("."))
+
+
+async def run_batch(rest, parser, lines, jobs, ordered=True):
+    """
+    Run the command lines concurrently, up to jobs operations at a time. The results are written as json lines,
+    {"line": lineno, "result": data} or {"line": lineno, "error": message}, in the input order or as they complete.
+    In the input order, a slow operation holds the following (done) ones, so at most jobs results are held.
+    :param lines: the command lines. If they are sys.stdin, '@-' values are rejected.
+    :return: the exit code - 1 if any command failed.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(jobs)
+    pending = collections.deque()   # (lineno, future, slot) in the input order
+    failed = 0
+
+    def write(lineno, future, slot):
+        nonlocal failed
+        if future.exception():
+            failed += 1
+            out = dict(line=lineno, error=str(future.exception()))
+        else:
+            out = dict(line=lineno, result=future.result())
+        print(json.dumps(out, sort_keys=True, default=str), flush=True)
+        if slot:
+            slots.release()
+
+    def flush(future=None):
+        while pending and pending[0][1].done():
+            write(*pending.popleft())
+
+    parser.cli.freeze()
+    with raising_help(parser, raise_help), concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        for lineno, cli_out in parser.cli.parse_many(lines, stdin=lines is not sys.stdin):
+            if isinstance(cli_out, multilevelcli.ParseExecption):
+                entry = (lineno, loop.create_future(), False)
+                entry[1].set_exception(cli_out)
+            else:
+                await slots.acquire()
+                entry = (lineno, loop.run_in_executor(executor, run_command, rest, cli_out), True)
+            if ordered:
+                pending.append(entry)
+                entry[1].add_done_callback(flush)
+            elif entry[2]:
+                entry[1].add_done_callback(lambda future, entry=entry: write(*entry))
+            else:
+                write(*entry)
+        # wait for all the operations to be written
+        for i in range(jobs):
+            await slots.acquire()
+    flush()
+    return 1 if failed else 0
+
+
+@contextlib.contextmanager
+def raising_help(parser, helpfn):
+    """
+    Make the help options call helpfn, that should raise HelpRquired rather than exit as the default help fn does.
+    The help fns are restored on exit, as the parser may be reused by a daemon.
+    """
+    helpfns = multilevelcli.defhelpfn, parser.cli.helpfn
+    multilevelcli.defhelpfn = parser.cli.helpfn = helpfn
+    try:
+        yield
+    finally:
+        multilevelcli.defhelpfn, parser.cli.helpfn = helpfns
+
+
 def noop(ent):
     assert isinstance(ent, multilevelcli.MultiLevelCliBase.ParseBase)
     #print (ent.usage())
@@ -220,6 +931,7 @@ def noop(ent):
 
 class CliParser(object):
     maxlevels = 5
+    snapshot_version = 1    # bump when the commands tree generation changes, to invalidate the tree snapshots
 
     class CmdParam(object):
         def __init__(self, cmd, name, t, desc, default, required):
@@ -245,7 +957,7 @@ class CliParser(object):
         return groups, command
 
     def resolve_command_from_url(self, url, method):
-        log.info("Resolve '%s' %s" % (url, method))
+        log.info("Resolve '%s' %s", url, method)
         a = url.split("/")
         if not a:
             return None, None
@@ -297,13 +1009,13 @@ class CliParser(object):
         for l in range(0, len(groups)):
             name = self.sanitize(groups[l])
             if l > self.maxlevels:
-                log.error("skip command due to too many groups'", groups)
+                log.error("skip command due to too many groups '%s'", groups)
                 return None
             if name in parent:
                 parent = parent[name]
             else:
                 # add new group
-                log.info("Adding new group '%s' level %d" % (name, l))
+                log.info("Adding new group '%s' level %d", name, l)
                 parent = parent.add_group(name)
         return parent
 
@@ -313,7 +1025,7 @@ class CliParser(object):
         :param object_name: an object from a OpenAPI model (under #/definitions).
         :return:  a dictionary with all properties, set to the default or None.
         '''
-        o = self.app.resolve('#/definitions/%s' % object_name).dump()
+        o = self.resolve_dump('#/definitions/%s' % object_name)
         assert o["type"] == "object"
 
         obj = {}
@@ -325,15 +1037,25 @@ class CliParser(object):
             elif p in o.get("required", []):
                 obj[p] = None   # to be filled later!
 
-        debug("get_object: '%s':" % (object_name), obj)
+        debug("get_object: '%s':", object_name, json_data=obj)
         return obj
 
+    def resolve_dump(self, ref):
+        """
+        Return the dump of the referenced definition. The dumps are cached, as a definition is usually referred by
+        many operations. The dumps are read only.
+        """
+        o = self.dumps.get(ref)
+        if o is None:
+            o = self.dumps[ref] = self.app.resolve(ref).dump()
+        return o
+
     def add_arg(self, c):
         assert isinstance(c, self.CmdParam)
         return self.add_arg(c.cmd, c.name, c.type, c.desc)
 
     def add_arg(self, cmd, name, atype, desc):
-        log.info("Adding argument for command '%s':'%s' type %s" % (cmd.full_name("."), name, atype))
+        log.info("Adding argument for command '%s':'%s' type %s", cmd.full_name("."), name, atype)
         cmd.add_argument(name, type=atype, description=desc)
 
     def add_opt(self, c):
@@ -341,13 +1063,13 @@ class CliParser(object):
         return self.add_opt(c.cmd, c.name, c.type, c.desc, c.default)
 
     def add_opt(self, cmd, name, otype, desc, default):
-        log.info("Adding option for command '%s':'%s' type %s" % (cmd.full_name("."), name, otype))
+        log.info("Adding option for command '%s':'%s' type %s", cmd.full_name("."), name, otype)
         cmd.add_option(None, name, type=otype, description=desc, default=(otype)(default) if default else None)
 
     def resolve_struct(self, cmd, ref) -> (dict, str):
         out = {}
         dict_desc = ""
-        o = self.app.resolve(ref).dump()
+        o = self.resolve_dump(ref)
         for p in o["properties"]:
             d = o["properties"][p]
             desc = d.get("description")
@@ -367,7 +1089,7 @@ class CliParser(object):
         return out, dict_desc
 
     def add_ref(self, cmd, ref, plist, prefix=""):
-        o = self.app.resolve(ref).dump()
+        o = self.resolve_dump(ref)
         for p in o["properties"]:
             d = o["properties"][p]
             desc = d.get("description", "")
@@ -418,12 +1140,12 @@ class CliParser(object):
         :return: array type def (compound) and description of array content
         '''
         if not 'items' in array:
-            log.info("Skipping array var for command '%s':'%s' - not items" % (cmd.full_name("."), name))
+            log.info("Skipping array var for command '%s':'%s' - not items", cmd.full_name("."), name)
             return  [], "" # can't handle that - hope that it is not that important....
         p = array['items']
         desc = array.get("description", "")
         if not isinstance(p, dict):
-            log.info("Skipping array var for command '%s':'%s' = items not a dict" % (cmd.full_name("."), name))
+            log.info("Skipping array var for command '%s':'%s' = items not a dict", cmd.full_name("."), name)
             return  [], "" # can't handle that - hope that it is not that important....
 
         ref = p.get("$ref", None)
@@ -465,8 +1187,8 @@ class CliParser(object):
         assert isinstance(op, spec.v2_0.objects.Operation)
         assert isinstance(parent, multilevelcli.MultiLevelCliBase.GroupType)
         assert isinstance(command, str)
-        log.info("Adding new command '%s':'%s' opid %s" % (str(parent), str(command), op.operationId))
-        cmd = parent.add_command(command, description=str(summary), ctx=op)
+        log.info("Adding new command '%s':'%s' opid %s", parent, command, op.operationId)
+        cmd = parent.add_command(command, description=str(summary), ctx=OpPlan(op, self.app).compile())
         self.commands[op.operationId] = cmd
 
         # first handle path params
@@ -498,11 +1220,20 @@ class CliParser(object):
 
         self.add_plist(plist)
 
-    def resolve_cmd(self, op):
+    def resolve_op(self, op):
+        """
+        Resolve the groups and the command name of an operation.
+        :return: (groups, command)
+        """
         assert isinstance(op, spec.v2_0.objects.Operation)
         groups, command = self.resolve_desc_hint(op.description)
         if not command:
             groups, command = self.resolve_command_from_url(op.path, op.method)
+        return groups, command
+
+    def resolve_cmd(self, op):
+        assert isinstance(op, spec.v2_0.objects.Operation)
+        groups, command = self.resolve_op(op)
 
         if not groups and not command:
             log.error("skip op command %s %s can't resolve groups/command", op.path, op.operationId)
@@ -514,20 +1245,70 @@ class CliParser(object):
 
         self.process_command(op, parent, command, op.summary)
 
+    def load_group(self, ops):
+        for op in ops:
+            self.resolve_cmd(op)
+
     def parse(self, cmdline):
         return self.cli.parse(cmdline)
 
+    def snapshot(self, cache_dir, schema):
+        """
+        Return the tree snapshot file path and key for the given schema, or (None, None) if there is no cache dir or
+        the schema is not a local file. The key is the schema content hash.
+        """
+        if not cache_dir or not os.path.isfile(schema):
+            return None, None
+        with open(schema, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        path = os.path.join(os.path.expanduser(cache_dir), "tree-%s.snapshot" % hashlib.sha256(os.path.abspath(schema).encode()).hexdigest()[:16])
+        return path, "%d:%s" % (self.snapshot_version, digest)
+
     def __init__(self, rest_srv, args, unparsed=None, show_tree=False):
         # new parser for rest of cmdline (unparsed)
         self.commands = {}
+        self.dumps = {}     # resolve_dump() cache
         self.rest = rest_srv
         self.app = rest_srv.app
 
-        self.cli = multilevelcli.MultiLevelArgParse(description='FaaS REST schema', defaultfn=noop if show_tree else None)
-
-        # prepare the commands and sub commands
-        for o in rest.app.op:
-            self.resolve_cmd(rest.app.op[o])
+        defaultfn = noop if show_tree else multilevelcli.usage_and_exit
+        snapshot, key = self.snapshot(args.cache_dir, rest_srv.schema)
+        if snapshot:
+            # the operations plans are built when their group is loaded (see MultiLevelArgParse.load_snapshot())
+            self.cli = multilevelcli.MultiLevelArgParse.load_snapshot(snapshot, key, ctx_resolver=lambda o: OpPlan(rest_srv.app.op[o], rest_srv.app))
+            if self.cli:
+                log.info("Loaded commands tree snapshot '%s'", snapshot)
+                self.cli.defaultfn = defaultfn
+                if show_tree:
+                    self.cli.show_tree()
+                    sys.exit(3)
+                return
+
+        self.cli = multilevelcli.MultiLevelArgParse(description='FaaS REST schema', defaultfn=defaultfn)
+
+        # prepare the commands and sub commands. The first level groups are lazy: their operations are resolved
+        # only when the group is used.
+        lazy = {}
+        for o in rest_srv.app.op:
+            op = rest_srv.app.op[o]
+            groups, command = self.resolve_op(op)
+            if not groups:
+                self.resolve_cmd(op)
+                continue
+            lazy.setdefault(self.sanitize(groups[0]), []).append(op)
+        for name, ops in lazy.items():
+            log.info("Adding new lazy group '%s' (%d operations)", name, len(ops))
+            self.cli.add_group(name, loader=lambda group, ops=ops: self.load_group(ops))
+
+        if snapshot:
+            # the snapshot holds the entire tree, where the operations are saved by their app.op key
+            op_keys = dict((id(rest_srv.app.op[o]), o) for o in rest_srv.app.op)
+            try:
+                os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+                self.cli.save_snapshot(snapshot, key, ctx_key=lambda plan: op_keys[id(plan.op)])
+                log.info("Saved commands tree snapshot '%s'", snapshot)
+            except Exception as e:
+                log.error("Failed to save commands tree snapshot '%s': %s", snapshot, e)
 
         if show_tree:
             self.cli.show_tree()
@@ -535,7 +1316,11 @@ class CliParser(object):
 
 
 def init_cmdline_parser():
-    cli = multilevelcli.MultiLevelArgParse(description='Swagger REST CLI', defaultfn=noop)
+    cli = multilevelcli.MultiLevelArgParse(description='Swagger REST CLI. Use "shell" as the command to run the commands '
+                                                       'from a prompt or a piped script, "batch" to run the stdin '
+                                                       'commands concurrently, "serve" to run as a daemon for '
+                                                       'swagger_cli_client.py, or "completion bash|zsh" to print a '
+                                                       'shell completion script', defaultfn=noop)
     cli.add_option("S", "server", type=str, description="override server url with the provided one")
     cli.add_option('s', 'schema', type=str, default="schema.json", description='URI to the service OpenAPI schema, e.g. http://localhost:8888/api/schema.json')
     cli.add_option('L', 'logfile', type=str, default="swagger_cli.log", description='set the log file')
@@ -548,6 +1333,24 @@ def init_cmdline_parser():
     cli.add_option('c', 'console', description="dump logs also to console")
     cli.add_option('T', 'tree', description="show command tree and exit")
     cli.add_option('K', 'key', type=str, default="", description="use api_key auth with the provided key")
+    cli.add_option('C', 'cache_dir', type=str, default="",
+                   description="cache dir for the resolved schema and the commands tree snapshots, e.g. ~/.cache/swagger_cli")
+    cli.add_option('P', 'pool_size', type=int, default=10, description="max HTTP connections per host")
+    cli.add_option(None, 'pool_hosts', type=int, default=10, description="number of hosts to keep HTTP connection pools for")
+    cli.add_option('R', 'retries', type=int, default=0,
+                   description="retries of failed connections and 502/503/504 replies of idempotent requests")
+    cli.add_option('t', 'timeout', type=float, default=0.0, description="HTTP connect/read timeout in seconds (0 - none)")
+    cli.add_option(None, 'no_keepalive', description="close the HTTP connection after each request")
+    cli.add_option(None, 'stream', description="write the reply items as json lines as they arrive, rather than "
+                                               "the whole reply at the end")
+    cli.add_option('A', 'all', description="fetch all the pages of a list command reply")
+    cli.add_option(None, 'max_items', type=int, default=0,
+                   description="fetch the pages of a list command reply up to the given number of items")
+    cli.add_option('j', 'jobs', type=int, default=8, description="max concurrent operations of the batch command")
+    cli.add_option(None, 'unordered', description="write the batch command results as they complete")
+    cli.add_option('U', 'socket', type=str, default="",
+                   description="the daemon unix socket (see the serve command), default $SWAGGER_CLI_SOCKET or %s" %
+                               swagger_cli_client.DEFAULT_SOCKET)
     return cli
 
 
@@ -596,38 +1399,201 @@ def setup_logging(loglevel, swaggerdebug, urllog, logfile, copy_console):
     return log
 
 
-if __name__ == "__main__":
+class DaemonWriter(io.TextIOBase):
+    """
+    stdout/stderr of a daemon request: the writes are streamed to the client.
+    """
+    def __init__(self, wfile, fd):
+        io.TextIOBase.__init__(self)
+        self.wfile = wfile
+        self.fd = fd
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        self.wfile.write((json.dumps(dict(fd=self.fd, data=s)) + "\n").encode())
+        return len(s)
+
+    def flush(self):
+        self.wfile.flush()
+
+
+class DaemonReader(io.TextIOBase):
+    """
+    stdin of a daemon request: the client stdin is requested on the first read, so the client reads its stdin only
+    if the command does (e.g. '@-' values, shell and batch).
+    """
+    def __init__(self, rfile, wfile):
+        io.TextIOBase.__init__(self)
+        self.rfile = rfile
+        self.wfile = wfile
+        self.buf = None
+
+    def readable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def text(self):
+        if self.buf is None:
+            self.wfile.write((json.dumps(dict(stdin=True)) + "\n").encode())
+            self.wfile.flush()
+            self.buf = io.StringIO(json.loads(self.rfile.readline())["stdin"])
+        return self.buf
+
+    def read(self, size=-1):
+        return self.text().read(size)
+
+    def readline(self, size=-1):
+        return self.text().readline(size)
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """
+    Run a swagger_cli_client request: a json line with the argv, environment and working dir. The output is streamed
+    back as json lines, followed by the exit code. The client stdin is requested when it is read (see DaemonReader).
+    """
+    def handle(self):
+        req = json.loads(self.rfile.readline())
+        log.info("Daemon request %s", req["argv"])
+        saved = sys.stdin, sys.stdout, sys.stderr, dict(os.environ), os.getcwd()
+        code = 0
+        try:
+            os.environ.clear()
+            os.environ.update(req["env"])
+            os.chdir(req["cwd"])
+            sys.stdin = DaemonReader(self.rfile, self.wfile)
+            sys.stdout = DaemonWriter(self.wfile, 1)
+            sys.stderr = DaemonWriter(self.wfile, 2)
+            main(req["argv"], self.server.contexts)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 0 if e.code is None else 1
+        except Exception as e:
+            log.error("Daemon request %s failed: %s", req["argv"], e, exc_info=True)
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = saved[:3]
+            os.environ.clear()
+            os.environ.update(saved[3])
+            os.chdir(saved[4])
+        self.wfile.write((json.dumps(dict(exit=code)) + "\n").encode())
+
+
+class Daemon(socketserver.UnixStreamServer):
+    def __init__(self, path, contexts):
+        self.contexts = contexts
+        socketserver.UnixStreamServer.__init__(self, path, DaemonHandler)
+
+
+def serve(path, contexts):
+    """
+    Serve the swagger_cli_client requests on a local unix socket, one at a time, until interrupted.
+    :param path: the socket path. The socket is accessible only by the user.
+    :param contexts: the loaded (validator, RESTClient, CliParser) by their schema options (see main()).
+    :return: the exit code.
+    """
+    if os.path.exists(path):
+        # a stale socket of a dead daemon is replaced
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            panic("A daemon is already serving '%s'" % path)
+        except OSError:
+            os.remove(path)
+        finally:
+            probe.close()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    umask = os.umask(0o177)
+    try:
+        server = Daemon(path, contexts)
+    finally:
+        os.umask(umask)
+    log.info("Daemon serving '%s'", path)
+    print("Serving on '%s'" % path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+    return 0
+
+
+def main(argv, contexts=None):
+    """
+    Run the cli with the given args (e.g. sys.argv[1:]). Exits by sys.exit() on errors.
+    :param contexts: a daemon's dict of the loaded (validator, RESTClient, CliParser) by their schema options. If set,
+            the logging is already set up, and the client and the commands tree are reused by the following runs.
+    """
+    global log
+    daemon = contexts is not None
     cli = init_cmdline_parser()
 
-    result = cli.parse(partial=True)
+    result = cli.parse(multilevelcli.MultiLevelCliBase.tokenize_argv(argv), partial=True)
     args = result.ns(0)
 
-    log = setup_logging(args.loglevel, args.swagger_loglevel, args.urllib_loglevel, args.logfile, args.console)
+    if not daemon:
+        log = setup_logging(args.loglevel, args.swagger_loglevel, args.urllib_loglevel, args.logfile, args.console)
     unparsed = result.unparsed_tokens()
-    info("UN: %s %s args %s" % (result, args, unparsed))
+    info("UN: %s %s args %s", result, args, unparsed)
 
     show_tree = args.tree
+    shell = unparsed == ["shell"]
+    batch = unparsed == ["batch"]
+    completion = len(unparsed) == 2 and unparsed[0] == "completion"
+    max_items = args.max_items if args.max_items else 0 if args.all else None
+    if unparsed == ["serve"]:
+        if daemon:
+            print("Already running as a daemon")
+            sys.exit(2)
+        contexts = {}
 
     # if show tree is requsted we want to continue and get the schema to show
     if not unparsed and not show_tree:
         print (cli.usage())
         sys.exit(1)
 
-    security = None if not args.key else dict(auth_type="api_key", params=args.key)
-    rest = RESTClient(args.schema, security=security, url=args.server)
-
     try:
-        parser = CliParser(rest, args, result.unparsed_tokens(), args.tree)
+        schema = os.path.abspath(args.schema) if os.path.isfile(args.schema) else args.schema
+        pool = dict(pool_hosts=args.pool_hosts, pool_size=args.pool_size, retries=args.retries,
+                    timeout=args.timeout or None, keep_alive=not args.no_keepalive)
+        key = (schema, args.server, args.key, args.cache_dir, tuple(sorted(pool.items())))
+        validator, rest, parser = contexts.get(key, (None, None, None)) if contexts is not None else (None, None, None)
+        if rest and os.path.isfile(args.schema) and rest.validator() != validator:
+            log.info("Schema '%s' is modified - reloading", args.schema)
+            rest = None
+        if rest is None:
+            security = None if not args.key else dict(auth_type="api_key", params=args.key)
+            rest = RESTClient(args.schema, security=security, url=args.server, cache_dir=args.cache_dir, pool=pool)
+            parser = CliParser(rest, args, result.unparsed_tokens(), args.tree)
+            if contexts is not None:
+                contexts[key] = rest.validator() if os.path.isfile(args.schema) else None, rest, parser
+        elif show_tree:
+            parser.cli.show_tree()
+            sys.exit(3)
+        if unparsed == ["serve"]:
+            sys.exit(serve(swagger_cli_client.socket_path(args.socket), contexts))
+        if shell:
+            sys.exit(run_shell(rest, parser, stream=args.stream, max_items=max_items))
+        if batch:
+            sys.exit(asyncio.run(run_batch(rest, parser, sys.stdin, max(args.jobs, 1), ordered=not args.unordered)))
+        if completion:
+            sys.exit(write_completion(cli, parser, schema, args.cache_dir, unparsed[1]))
         cli_out = parser.parse(result.unparsed_tokens())
     except multilevelcli.ParseExecption as e:
         print (str(e))
         sys.exit(2)
 
     try:
-        exec_command(rest, cli_out)
+        exec_command(rest, cli_out, stream=args.stream, max_items=max_items)
     except ResultError as e:
         print (str(e))
         sys.exit(1)
 
 
-
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Thin client of the swagger_cli daemon (swagger_cli.py serve). The args, environment and working dir are forwarded to
+the daemon, and its stdout, stderr and exit code are streamed back. stdin is read and forwarded only when the daemon
+requests it, i.e. when the command reads it. If no daemon is running the command is run by swagger_cli.py itself, so
+the client can replace swagger_cli.py invocations as is.
+Only the standard library is imported here, to keep the client startup minimal.
+"""
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET = "~/.cache/swagger_cli/daemon.sock"
+
+
+def socket_path(path=None):
+    """
+    Return the daemon socket path: the given path, or $SWAGGER_CLI_SOCKET, or the default.
+    """
+    return os.path.expanduser(path or os.environ.get("SWAGGER_CLI_SOCKET") or DEFAULT_SOCKET)
+
+
+def socket_arg(argv):
+    """
+    Return the -U/--socket option value of the swagger_cli args, or None.
+    """
+    for i, arg in enumerate(argv):
+        if arg in ("-U", "--socket"):
+            return argv[i + 1] if i + 1 < len(argv) else None
+        if arg.startswith("--socket="):
+            return arg[len("--socket="):]
+    return None
+
+
+def run(argv, path=None):
+    """
+    Run the command by the daemon.
+    :return: the command exit code, or None if there is no daemon.
+    """
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_path(path))
+    except OSError:
+        s.close()
+        return None
+
+    with s, s.makefile("rwb") as f:
+        f.write((json.dumps(dict(argv=argv, env=dict(os.environ), cwd=os.getcwd())) + "\n").encode())
+        f.flush()
+        for line in f:
+            msg = json.loads(line)
+            if "exit" in msg:
+                return msg["exit"]
+            if "stdin" in msg:
+                stdin = "" if sys.stdin is None else sys.stdin.read()
+                f.write((json.dumps(dict(stdin=stdin)) + "\n").encode())
+                f.flush()
+                continue
+            out = sys.stdout if msg["fd"] == 1 else sys.stderr
+            out.write(msg["data"])
+            out.flush()
+    # the command may have been (partially) run, so it is not run again
+    print("swagger_cli daemon connection is lost", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    code = run(sys.argv[1:], socket_arg(sys.argv[1:]))
+    if code is None:
+        cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "swagger_cli.py")
+        os.execv(sys.executable, [sys.executable, cli] + sys.argv[1:])
+    sys.exit(code)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+swagger_cli tests: the commands are run against a local stand-in server of a small pets schema.
+"""
+import contextlib
+import http.server
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from urllib.parse import parse_qsl, urlsplit
+
+import multilevelcli
+import swagger_cli
+import swagger_cli_client
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PETS = [dict(name="p%d" % i, tag="dog") for i in range(5)]
+OWNERS = [dict(name="o%d" % i) for i in range(3)]
+
+SCHEMA = {
+    "swagger": "2.0",
+    "info": {"title": "pets", "version": "1"},
+    "basePath": "/v1",
+    "schemes": ["http"],
+    "consumes": ["application/json"],
+    "produces": ["application/json"],
+    "definitions": {
+        "Pet": {
+            "type": "object",
+            "required": ["name"],
+            "properties": {
+                "name": {"type": "string"},
+                "tag": {"type": "string", "default": "dog"},
+                "tags": {"type": "array", "items": {"type": "string"}},
+            },
+        },
+    },
+    "paths": {
+        "/pets": {
+            "get": {
+                "operationId": "listPets",
+                "parameters": [
+                    {"name": "limit", "in": "query", "type": "integer"},
+                    {"name": "offset", "in": "query", "type": "integer"},
+                ],
+                "responses": {"200": {"description": "pets",
+                                      "schema": {"type": "array", "items": {"$ref": "#/definitions/Pet"}}}},
+            },
+            "post": {
+                "operationId": "newPet",
+                "parameters": [{"name": "body", "in": "body", "required": True,
+                                "schema": {"$ref": "#/definitions/Pet"}}],
+                "responses": {"201": {"description": "the new pet", "schema": {"$ref": "#/definitions/Pet"}}},
+            },
+        },
+        "/owners": {
+            "get": {
+                "operationId": "listOwners",
+                "parameters": [{"name": "page_token", "in": "query", "type": "string"}],
+                "responses": {"200": {"description": "a page of owners", "schema": {
+                    "type": "object",
+                    "properties": {"owners": {"type": "array", "items": {"type": "object"}},
+                                   "next_token": {"type": "string"}}}}},
+            },
+        },
+        "/pets/{name}": {
+            "get": {
+                "operationId": "getPet",
+                "parameters": [{"name": "name", "in": "path", "type": "string", "required": True}],
+                "responses": {"200": {"description": "a pet", "schema": {"$ref": "#/definitions/Pet"}}},
+            },
+        },
+    },
+}
+
+
+class PetsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    The stand-in server: the pets list is paged by limit (default 2) and offset, and the owners list by a page token
+    (2 owners per page). The requests are recorded.
+    """
+    protocol_version = "HTTP/1.1"
+    requests = []
+    ports = []      # the client ports of the requests
+
+    def reply(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        self.requests.append(("GET", url.path, query))
+        self.ports.append(self.client_address[1])
+        if url.path == "/v1/pets":
+            offset = int(query.get("offset", 0))
+            return self.reply(200, PETS[offset:offset + int(query.get("limit", 2))])
+        if url.path == "/v1/owners":
+            offset = int(query.get("page_token", 0))
+            page = dict(owners=OWNERS[offset:offset + 2])
+            if offset + 2 < len(OWNERS):
+                page["next_token"] = str(offset + 2)
+            return self.reply(200, page)
+        if url.path.startswith("/v1/pets/"):
+            return self.reply(200, dict(name=url.path.rsplit("/", 1)[1], tag="dog", tags=["x", "y"]))
+        self.reply(404, {})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+        self.requests.append(("POST", self.path, body))
+        self.reply(201, body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(object):
+    """
+    The stand-in server thread and the schema file that points to it.
+    """
+    def __init__(self):
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PetsHandler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.dir = tempfile.TemporaryDirectory()
+        self.schema = os.path.join(self.dir.name, "pets.json")
+        with open(self.schema, "w") as f:
+            json.dump(dict(SCHEMA, host="%s:%d" % self.httpd.server_address), f)
+        self.requests = PetsHandler.requests = []
+        self.ports = PetsHandler.ports = []
+        self.rest = None
+        self.parser = None
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.dir.cleanup()
+
+    def parse(self, argv):
+        """
+        :return: the RESTClient and the CliResult of the given command line.
+        """
+        if self.rest is None:
+            self.rest = swagger_cli.RESTClient(self.schema)
+            self.parser = swagger_cli.CliParser(self.rest, swagger_cli.init_cmdline_parser().parse(
+                [], partial=True).ns(0), [], False)
+        return self.rest, self.parser.parse(multilevelcli.MultiLevelCliBase.tokenize_argv(argv))
+
+    def main(self, argv, stdin="", code=0):
+        """
+        Run swagger_cli.main() on the given command line.
+        :param stdin: the stdin text.
+        :param code: the expected exit code.
+        :return: the output.
+        """
+        out = io.StringIO()
+        saved = sys.stdin
+        sys.stdin = io.StringIO(stdin)
+        exit_code = 0
+        try:
+            with contextlib.redirect_stdout(out):
+                swagger_cli.main(["-s", self.schema, "-L", os.path.join(self.dir.name, "log")] + argv)
+        except SystemExit as e:
+            exit_code = e.code
+        finally:
+            sys.stdin = saved
+        assert exit_code == code, "exit code %s: %s" % (exit_code, out.getvalue())
+        return out.getvalue()
+
+
+def test_request(server):
+    rest, result = server.parse(["pets", "new", "rex", "--tag", "cat"])
+    assert isinstance(result.args(), multilevelcli.Namespace)
+    req, resp = rest.request(result.command_ctx(), result.args(), result.opt())
+    rest.client.request((req, resp))
+    assert resp.status == 201
+    assert server.requests[-1] == ("POST", "/v1/pets", dict(name="rex", tag="cat"))
+    # the body skeleton holds the schema defaults
+    plan = result.command_ctx()
+    assert plan.skeleton == dict(tag="dog")
+    rest.client.request(rest.request(plan, dict(name="max"), {}))
+    assert server.requests[-1] == ("POST", "/v1/pets", dict(name="max", tag="dog"))
+
+    rest, result = server.parse(["pets", "info", "abc"])
+    req, resp = rest.request(result.command_ctx(), result.args(), result.opt())
+    rest.client.request((req, resp))
+    assert server.requests[-1] == ("GET", "/v1/pets/abc", {})
+    assert resp.data["name"] == "abc"
+
+
+def test_pool(server):
+    rest, result = server.parse(["pets", "info", "abc"])
+    for keep_alive, connections in ((True, 1), (False, 3)):
+        client = swagger_cli.PooledClient(None, retries=1, timeout=10, keep_alive=keep_alive)
+        del server.ports[:]
+        for _ in range(3):
+            resp = client.request(rest.request(result.command_ctx(), result.args(), result.opt()))
+            assert resp.status == 200 and resp.data["name"] == "abc"
+        assert len(set(server.ports)) == connections
+        rs = client.send(rest.request(result.command_ctx(), result.args(), result.opt()))
+        with rs:
+            assert rs.status_code == 200 and json.loads(rs.text)["tags"] == ["x", "y"]
+
+
+def test_exec(server):
+    assert json.loads(server.main(["pets", "list"])) == PETS[:2]
+    assert json.loads(server.main(["pets", "list", "--offset", "4"])) == PETS[4:]
+    assert json.loads(server.main(["pets", "info", "abc"])) == dict(name="abc", tag="dog", tags=["x", "y"])
+    assert json.loads(server.main(["pets", "new", "rex"])) == dict(name="rex", tag="dog")
+
+
+def test_paging(server):
+    assert json.loads(server.main(["--all", "pets", "list"])) == PETS
+    assert json.loads(server.main(["--max_items", "3", "pets", "list"])) == PETS[:3]
+    assert [json.loads(line) for line in server.main(["--all", "--stream", "pets", "list"]).splitlines()] == PETS
+    assert json.loads(server.main(["--all", "owners", "list"])) == OWNERS
+    assert server.requests[-2:] == [("GET", "/v1/owners", {}), ("GET", "/v1/owners", dict(page_token="2"))]
+    # not list operations
+    info = dict(name="abc", tag="dog", tags=["x", "y"])
+    assert json.loads(server.main(["--all", "pets", "info", "abc"])) == info
+    assert json.loads(server.main(["--all", "pets", "new", "rex"])) == dict(name="rex", tag="dog")
+
+    rest, result = server.parse(["pets", "list", "--limit", "3"])
+    pages = swagger_cli.Paginator(rest, result.command_ctx(), result.command(), result.args(), result.opt())
+    assert pages.lists()
+    assert list(pages) == PETS
+    assert [r[2] for r in server.requests[-2:]] == [dict(limit="3"), dict(limit="3", offset="3")]
+    rest, result = server.parse(["pets", "info", "abc"])
+    pages = swagger_cli.Paginator(rest, result.command_ctx(), result.command(), result.args(), result.opt())
+    assert not pages.lists()
+    assert list(pages) == [info]
+
+
+def test_stream(server):
+    def lines(argv):
+        return [json.loads(line) for line in server.main(["--stream"] + argv).splitlines()]
+    assert lines(["pets", "list"]) == PETS[:2]
+    assert lines(["owners", "list"]) == OWNERS[:2]
+    info = dict(name="abc", tag="dog", tags=["x", "y"])
+    assert lines(["pets", "info", "abc"]) == [info]
+    assert lines(["--all", "pets", "info", "abc"]) == [info]
+
+    # split to single chars, to parse values across the chunks
+    def items(text, member=None):
+        return list(swagger_cli.JsonItems(iter(text), member))
+    assert items('[1, 12.5, "a]", {"b": [2]}, [] ]') == [1, 12.5, "a]", {"b": [2]}, []]
+    assert items("[]") == []
+    assert items('{"a": [1], "b": [2], "c": 3}') == [{"a": [1], "b": [2], "c": 3}]
+    assert items('{"next": "t", "a": [1, 2], "c": 3}', "a") == [1, 2]
+    assert items('{"a": 1}', "a") == [{"a": 1}]
+    assert items('{}', "a") == [{}]
+    assert items(' 17 ') == [17]
+    assert items('"s"') == ["s"]
+    assert items('') == []
+
+
+def test_cache(server):
+    cache = os.path.join(server.dir.name, "cache")
+    commands = (["pets", "info", "abc"], ["--all", "pets", "list"], ["pets", "new", "rex"])
+    expect = [server.main(argv) for argv in commands]
+    for _ in range(2):
+        assert [server.main(["-C", cache] + argv) for argv in commands] == expect
+        assert sorted(name.split("-")[0] for name in os.listdir(cache)) == ["app", "tree"]
+    # the first run saves the app and the tree snapshot, the others load them
+    with open(os.path.join(server.dir.name, "log")) as f:
+        log = f.read()
+    assert log.count("Loaded schema app cache") == 5 and log.count("Loaded commands tree snapshot") == 5
+    # an unwritable cache dir is logged, the command still runs
+    assert server.main(["-C", os.path.join(server.schema, "cache")] + commands[0]) == expect[0]
+    with open(os.path.join(server.dir.name, "log")) as f:
+        assert "Failed to save commands tree snapshot" in f.read()
+
+
+def test_batch(server):
+    script = "pets info a\npets nosuch\n\npets info b\npets new rex\n"
+    for argv in (["-j", "2"], ["-j", "2", "--unordered"], ["-j", "1"]):
+        results = sorted((json.loads(line) for line in server.main(argv + ["batch"], script, code=1).splitlines()),
+                         key=lambda r: r["line"])
+        assert [r["line"] for r in results] == [1, 2, 4, 5]
+        assert results[0]["result"]["name"] == "a" and "error" in results[1] and results[2]["result"]["name"] == "b"
+        assert results[3]["result"] == dict(name="rex", tag="dog")
+    # the commands are read from stdin, so '@-' values are rejected rather than read the following commands
+    results = [json.loads(line) for line in server.main(["batch"], "pets new @-\npets info c\n", code=1).splitlines()]
+    assert "stdin" in results[0]["error"] and results[1]["result"]["name"] == "c"
+
+
+def test_shell(server):
+    # the session options apply to the shell commands
+    def lines(argv, script):
+        return [json.loads(line) for line in server.main(argv + ["shell"], stdin=script).splitlines()]
+    info = dict(name="abc", tag="dog", tags=["x", "y"])
+    assert lines(["--stream"], "pets list\npets info abc\n") == PETS[:2] + [info]
+    assert lines(["--all", "--stream"], "pets list\npets info abc\n") == PETS + [info]
+    assert lines(["--max_items", "3", "--stream"], "pets list\n") == PETS[:3]
+    assert json.loads(server.main(["--all", "shell"], stdin="pets list\n")) == PETS
+    out = server.main(["shell"], stdin="pets new @-\npets info abc\n", code=1).splitlines()
+    assert out[0].startswith("line 1:") and "stdin" in out[0] and json.loads("".join(out[1:])) == info
+
+
+def test_daemon(server):
+    sock = os.path.join(server.dir.name, "daemon.sock")
+    log = os.path.join(server.dir.name, "daemon.log")
+    argv = ["-s", server.schema, "-U", sock]
+    assert swagger_cli_client.socket_arg(argv + ["pets", "list"]) == sock
+    assert swagger_cli_client.socket_arg(["--socket=" + sock, "pets", "list"]) == sock
+    assert swagger_cli_client.socket_arg(["pets", "list"]) is None
+
+    client = [sys.executable, os.path.join(HERE, "swagger_cli_client.py")] + argv
+    daemon = subprocess.Popen([sys.executable, os.path.join(HERE, "swagger_cli.py"), "-L", log] + argv + ["serve"])
+    try:
+        for _ in range(300):
+            if os.path.exists(sock):
+                break
+            time.sleep(0.1)
+        # the client doesn't read the stdin of commands that don't read it
+        out = subprocess.run(["sh", "-c", 'while read name; do "$@" pets info "$name"; done', "sh"] + client,
+                             input="a\nb\nc\n", stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+        assert out.count('"name"') == 3
+        out = subprocess.run(client + ["pets", "new", "@-"], input="rex", stdout=subprocess.PIPE,
+                             universal_newlines=True, check=True).stdout
+        assert json.loads(out) == dict(name="rex", tag="dog")
+        out = subprocess.run(client + ["--stream", "shell"], input="pets info a\npets info b\n",
+                             stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+        assert [json.loads(line)["name"] for line in out.splitlines()] == ["a", "b"]
+        with open(log) as f:
+            assert f.read().count("Daemon request") == 5
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+if __name__ == "__main__":
+    swagger_cli.log = logging.getLogger("swagger_clitest")
+    server = Server()
+    try:
+        for name, test in sorted(globals().items()):
+            if name.startswith("test_") and callable(test):
+                test(server)
+                print("%s passed" % name)
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        server.close()
+    print("### Success!")